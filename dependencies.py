@@ -1,16 +1,449 @@
+import logging
 import os
-import joblib
+import threading
+import time
+import weakref
+import numpy as np
+from scipy import sparse
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from fastapi import Depends
+from sqlalchemy.orm import Session
+from src.database import get_read_db, ReadSessionLocal
+from src.store import CatalogStore
+from src.batch import iter_batch_recommendations
+from src.executor import BoundedExecutor
+from src.cache import RecommendationCache
+from src.artifacts import KEEP_VERSIONS, artifacts_lock, current_version, hold_version, load_artifacts, manifest_timestamp, prune_versions, save_artifacts
+from src.ann import IVFIndex, DEFAULT_N_PROBE
+from src.content import ContentModel, ContentVectorizer
+from src.factorization import FactorModel
+from src.metrics import LatencyStats
+from src.matrix_builder import UserItemMatrix, build_user_item_matrix_from_arrays, build_user_neighbors, compute_user_neighbor_row
+
+logger = logging.getLogger(__name__)
 
 DATA_PATH = "precomputed_data"
+# Cada cuánto se escribe una versión nueva de los artefactos con los ratings recibidos desde el precálculo
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("COMPACTION_INTERVAL_SECONDS", 3600))
+# Versiones anteriores a la activa que se conservan en disco después de cada compactación
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", KEEP_VERSIONS))
+# Margen para los ratings con timestamp anterior a la lectura del precálculo que se confirmaron
+# después (el mismo que usa CatalogStore al releer): esos se vuelven a aplicar por si acaso.
+# También vale para los tags del modelo de contenido.
+RATINGS_REPLAY_MARGIN_SECONDS = 60
+# Cada cuánto se mira si precompute_data.py ha publicado una versión nueva (0 = no se vigila)
+MODEL_WATCH_INTERVAL_SECONDS = int(os.getenv("MODEL_WATCH_INTERVAL_SECONDS", 30))
+# Pool para el cálculo de recomendaciones: hilos, tareas en espera antes de responder 429,
+# timeout por petición y procesos para el scoring en Python puro (0 = sin pool de procesos)
+RECOMMENDER_WORKERS = int(os.getenv("RECOMMENDER_WORKERS", os.cpu_count() or 4))
+RECOMMENDER_QUEUE_SIZE = int(os.getenv("RECOMMENDER_QUEUE_SIZE", 32))
+RECOMMENDER_TIMEOUT_SECONDS = float(os.getenv("RECOMMENDER_TIMEOUT_SECONDS", 10))
+RECOMMENDER_PROCESS_WORKERS = int(os.getenv("RECOMMENDER_PROCESS_WORKERS", 0))
+# Límite de cada trozo del endpoint batch (0 = sin límite): la respuesta ya ha empezado, así que
+# no puede acabar en 504
+RECOMMENDER_BATCH_TIMEOUT_SECONDS = float(os.getenv("RECOMMENDER_BATCH_TIMEOUT_SECONDS", 0))
+# Caché de resultados por usuario de /recommend y /recommend/hybrid
+RECOMMENDATIONS_CACHE_TTL = float(os.getenv("RECOMMENDATIONS_CACHE_TTL", 300))
+RECOMMENDATIONS_CACHE_MAX_BYTES = int(os.getenv("RECOMMENDATIONS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Listas del índice IVF (si la versión lo tiene) que mira la parte de contenido de /recommend/hybrid
+# (más listas, más recall y más latencia); 0 compara el perfil con todo el catálogo (búsqueda exacta)
+HYBRID_ANN_PROBES = int(os.getenv("HYBRID_ANN_PROBES", DEFAULT_N_PROBE))
 
 class PrecomputedDataManager:
+    def __init__(self, data_path: str, version: str = None):
+        # Los arrays se abren mapeados en memoria (solo lectura) desde la versión indicada o la actual
+        self.data_path = data_path
+        self.version = version or current_version(data_path)
+        # Mientras exista este snapshot, prune_versions no borra su versión
+        weakref.finalize(self, hold_version(os.path.join(data_path, self.version)).close)
+        manifest, artifacts = load_artifacts(os.path.join(data_path, self.version))
+        self.metadata = manifest["metadata"]
+        self.user_neighbors_k = self.metadata.get("user_neighbors_k")
+        # Los ratings anteriores a ratings_read_at (cuando se leyó la tabla para esta versión;
+        # created_at en las versiones que no lo guardan) ya están en la matriz
+        ratings_read_at = self.metadata.get("ratings_read_at") or manifest_timestamp(manifest)
+        self.ratings_since = ratings_read_at - RATINGS_REPLAY_MARGIN_SECONDS
+        # Lo mismo para las películas y tags del modelo de contenido
+        self.content_read_at = self.metadata.get("content_read_at") or manifest_timestamp(manifest)
+
+        self.user_item_matrix = UserItemMatrix(artifacts["user_item_matrix"], artifacts["user_ids"], artifacts["movie_ids"])
+        self.user_neighbors = artifacts["user_neighbors"]
+        self.content = self._load_content(artifacts)
+        # Factores de películas del modelo "svd" (las versiones anteriores no los tienen)
+        self.factor_model = None
+        if "item_factors" in artifacts:
+            # Tras una compactación los factores siguen alineados con las películas con las que se entrenaron
+            self.factor_model = FactorModel(artifacts["item_factors"], artifacts.get("item_factor_movie_ids", artifacts["movie_ids"]))
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        # Filas de vecinos recalculadas para usuarios con ratings nuevos
+        self._neighbor_cache = {}
+        self._content_lock = threading.Lock()
+
+    @staticmethod
+    def _load_content(artifacts):
+        # Vectores de contenido de cada película: embeddings densos si precompute_data.py se ejecutó
+        # con --content-dim, si no la matriz TF-IDF dispersa
+        vectors = artifacts["content_embeddings"] if "content_embeddings" in artifacts else artifacts["tfidf_matrix"]
+        index = None
+        # El índice IVF solo se usa sobre embeddings: las versiones anteriores lo guardaban sobre
+        # el TF-IDF, donde el producto con todo el catálogo es más rápido y exacto
+        if HYBRID_ANN_PROBES > 0 and "content_ivf_centroids" in artifacts and "content_embeddings" in artifacts:
+            index = IVFIndex(artifacts["content_ivf_centroids"], artifacts["content_ivf_offsets"], artifacts["content_ivf_items"], n_probe=HYBRID_ANN_PROBES)
+        # Sin el vocabulario guardado (versiones anteriores) no se pueden añadir películas
+        vectorizer = None
+        if "content_vocabulary" in artifacts:
+            vectorizer = ContentVectorizer(artifacts["content_vocabulary"].to_list(), artifacts["content_idf"], artifacts.get("content_svd_components"))
+        return ContentModel(
+            artifacts["content_movie_ids"], artifacts["content_titles"].to_list(), vectors,
+            (artifacts["content_neighbor_indices"], artifacts["content_neighbor_scores"]), index, vectorizer
+        )
+
+    def user_model(self, user_id):
+        # Matriz usuario-item y fila de vecinos del usuario, tomadas juntas por si hay una compactación en curso
+        with self._lock:
+            user_item_matrix, user_neighbors = self.user_item_matrix, self.user_neighbors
+            if user_id not in user_item_matrix.updated_users:
+                return user_item_matrix, user_neighbors[user_item_matrix.user_index(user_id)]
+            neighbors = self._neighbor_cache.get(user_id)
+        if neighbors is None:
+            neighbors = compute_user_neighbor_row(user_item_matrix, user_id, k=self.user_neighbors_k)
+            with self._lock:
+                if self.user_item_matrix is user_item_matrix:
+                    self._neighbor_cache[user_id] = neighbors
+        return user_item_matrix, neighbors
+
+    def user_block(self, user_ids):
+        # Como user_model para varios usuarios a la vez: filas de vecinos apiladas (len(user_ids) x usuarios)
+        with self._lock:
+            user_item_matrix, user_neighbors = self.user_item_matrix, self.user_neighbors
+            updated = {user_id: self._neighbor_cache.get(user_id) for user_id in user_ids if user_id in user_item_matrix.updated_users}
+        if not updated:
+            return user_item_matrix, user_neighbors[[user_item_matrix.user_index(user_id) for user_id in user_ids]]
+
+        rows = []
+        for user_id in user_ids:
+            if user_id in updated:
+                row = updated[user_id]
+                if row is None:
+                    row = compute_user_neighbor_row(user_item_matrix, user_id, k=self.user_neighbors_k)
+            else:
+                row = user_neighbors[user_item_matrix.user_index(user_id)]
+            rows.append(row)
+        return user_item_matrix, sparse.vstack(rows, format='csr')
+
+    def apply_ratings(self, ratings):
+        # Aplica sobre la matriz los ratings de `ratings` (RatingArrays de CatalogStore) que esta
+        # versión no incluye todavía; devuelve los userIds afectados
+        ratings = ratings.take(ratings.timestamps >= self.ratings_since)
+        if not len(ratings):
+            return []
+        updated = set()
+        with self._lock:
+            for user_id, movie_id, rating in zip(ratings.user_ids.tolist(), ratings.movie_ids.tolist(), ratings.ratings.tolist()):
+                if self.user_item_matrix.apply_rating(user_id, movie_id, rating):
+                    self._neighbor_cache.pop(user_id, None)
+                    updated.add(user_id)
+        return sorted(updated)
+
+    def update_movie_content(self, movie_id, title, tags):
+        # Añade la película al modelo de contenido o recalcula su vector con sus tags actuales.
+        # Devuelve False si la versión cargada no guarda el vocabulario necesario.
+        with self._content_lock:
+            if self.content.vectorizer is None:
+                return False
+            self.content = self.content.with_movie(movie_id, title, tags)
+        return True
+
+    def stale_content(self, store):
+        # movieIds que el modelo de contenido de esta versión no refleja: películas del catálogo
+        # que no tiene y películas con tags posteriores a su precálculo
+        catalog_ids = store.movies['movieId'].to_numpy(dtype=np.int64)
+        _, found = self.content.movie_indices.rows(catalog_ids)
+        retagged = store.tagged_movies(since=self.content_read_at - RATINGS_REPLAY_MARGIN_SECONDS)
+        return np.union1d(catalog_ids[~found], retagged)
+
+    def compact(self, ratings, ratings_read_at, output_path=None):
+        # Escribe una versión nueva de los artefactos con la matriz usuario-item y los vecinos
+        # reconstruidos a partir de `ratings` (todos los ratings vigentes, RatingArrays de
+        # CatalogStore leídos en ratings_read_at); el resto se copia de esta versión.
+        # Devuelve el nombre de la versión nueva.
+        _, artifacts = load_artifacts(os.path.join(self.data_path, self.version))
+        user_item_matrix = build_user_item_matrix_from_arrays(ratings.user_ids, ratings.movie_ids, ratings.ratings)
+        if "item_factors" in artifacts:
+            # Los factores SVD no se reentrenan
+            artifacts.setdefault("item_factor_movie_ids", artifacts["movie_ids"])
+        # Las versiones anteriores guardaban los agregados de popularidad, que ya no se usan
+        artifacts.pop('movie_rating_counts', None)
+        artifacts.pop('movie_rating_sums', None)
+        artifacts.update({
+            'user_item_matrix': user_item_matrix.matrix,
+            'user_ids': user_item_matrix.user_ids,
+            'movie_ids': user_item_matrix.movie_ids,
+            'user_neighbors': build_user_neighbors(user_item_matrix, k=self.user_neighbors_k),
+        })
+        # El contenido se copia tal cual, así que sigue valiendo el content_read_at de esta versión
+        metadata = dict(
+            self.metadata, ratings_read_at=ratings_read_at, content_read_at=self.content_read_at, compacted_from=self.version,
+            n_users=int(user_item_matrix.shape[0]), n_ratings=int(user_item_matrix.matrix.nnz),
+        )
+        version_path = save_artifacts(output_path or self.data_path, artifacts, metadata)
+        return os.path.basename(version_path)
+
+class SnapshotManager:
+    # Guarda la versión activa de los datos precalculados y la sustituye por otra sin reiniciar.
+    # La versión nueva se carga entera en segundo plano y después se cambia la referencia de
+    # golpe: cada petición usa el snapshot que obtuvo al empezar, nunca uno a medio cargar.
     def __init__(self, data_path: str):
-        self.user_item_matrix = joblib.load(os.path.join(data_path, "user_item_matrix.joblib"))
-        self.tfidf_matrix = joblib.load(os.path.join(data_path, "tfidf_matrix.joblib"))
-        self.movie_indices = joblib.load(os.path.join(data_path, "movie_indices.joblib"))
-        self.movies_df_content = joblib.load(os.path.join(data_path, "movies_df_content.joblib"))
+        self.data_path = data_path
+        self._lock = threading.Lock()
+        self._current = None
+        self._loading_version = None
+        self._loaders = []
+        self._listeners = []
+        self.last_error = None
+
+    def current(self):
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    snapshot = PrecomputedDataManager(self.data_path)
+                    self._prepare(snapshot)
+                    self._current = snapshot
+                    self._prepare(snapshot)
+        return self._current
+
+    @property
+    def active(self):
+        # Snapshot activo, o None si todavía no se ha cargado ninguno (sin cargarlo)
+        return self._current
+
+    def on_load(self, callback):
+        # callback(snapshot) prepara cada snapshot recién cargado (p. ej. le aplica los ratings
+        # posteriores a su precálculo): se llama antes de activarlo y otra vez justo después, por
+        # lo que haya llegado al anterior durante el cambio
+        self._loaders.append(callback)
+
+    def on_switch(self, callback):
+        # callback(snapshot) se llama cada vez que se activa un snapshot nuevo
+        self._listeners.append(callback)
+
+    def _prepare(self, snapshot):
+        for callback in self._loaders:
+            callback(snapshot)
+
+    @property
+    def loading_version(self):
+        return self._loading_version
+
+    def reload(self, version: str = None, background: bool = True):
+        # Carga `version` (o la marcada en CURRENT) y la activa; devuelve la versión objetivo
+        version = version or current_version(self.data_path)
+        if os.path.basename(version) != version or not os.path.isdir(os.path.join(self.data_path, version)):
+            raise FileNotFoundError(version)
+        with self._lock:
+            if self._loading_version is not None:
+                return self._loading_version
+            self._loading_version = version
+        if background:
+            threading.Thread(target=self._load, args=(version,), name="snapshot-loader", daemon=True).start()
+        else:
+            self._load(version)
+        return version
+
+    def _load(self, version):
+        try:
+            snapshot = PrecomputedDataManager(self.data_path, version)
+            self._prepare(snapshot)
+            with self._lock:
+                self._current = snapshot
+            # Lo que llegó al snapshot anterior mientras se hacía el cambio
+            self._prepare(snapshot)
+            for callback in self._listeners:
+                callback(snapshot)
+            self.last_error = None
+            logger.info(f"Model snapshot {version} is now active.")
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Failed to load model snapshot {version}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._loading_version = None
+
+    def check_for_update(self):
+        version = current_version(self.data_path)
+        if self._current is not None and version != self._current.version:
+            logger.info(f"New model snapshot {version} detected.")
+            self.reload(version)
+
+    def status(self):
+        snapshot = self._current
+        return {
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "loading_version": self._loading_version,
+            "last_error": self.last_error,
+            # Tiempo de cada etapa de precompute_data.py (entrenamiento de cada modelo incluido)
+            "build_seconds": snapshot.metadata.get("stage_seconds") if snapshot else None,
+        }
+
+snapshots = SnapshotManager(DATA_PATH)
 
-@lru_cache()
 def get_data_manager():
-    return PrecomputedDataManager(DATA_PATH)
\ No newline at end of file
+    return snapshots.current()
+
+recommender_executor = BoundedExecutor(
+    max_workers=RECOMMENDER_WORKERS,
+    max_queue=RECOMMENDER_QUEUE_SIZE,
+    timeout=RECOMMENDER_TIMEOUT_SECONDS,
+    process_workers=RECOMMENDER_PROCESS_WORKERS,
+    name="recommender",
+)
+
+# Tiempo de cálculo de /recommend por modelo (solo cuando no viene de la caché)
+scoring_latency = LatencyStats()
+
+recommendation_cache = RecommendationCache(ttl=RECOMMENDATIONS_CACHE_TTL, max_bytes=RECOMMENDATIONS_CACHE_MAX_BYTES)
+# Con una versión nueva del modelo ningún resultado anterior vale
+snapshots.on_switch(lambda snapshot: recommendation_cache.clear())
+
+_process_snapshot = None
+
+def score_batch_in_process(data_path, version, user_ids, top_n=10, model="collaborative", block_size=256):
+    # Se ejecuta dentro de un proceso del pool: cada proceso abre (mmap) la versión pedida una
+    # sola vez y la reutiliza. Solo ve los datos precalculados, no los ratings recibidos por
+    # /rate desde que se cargó la versión.
+    global _process_snapshot
+    if _process_snapshot is None or _process_snapshot.version != version:
+        _process_snapshot = PrecomputedDataManager(data_path, version)
+    return list(iter_batch_recommendations(_process_snapshot, user_ids, top_n=top_n, model=model, block_size=block_size))
+
+def start_snapshot_watcher(interval=MODEL_WATCH_INTERVAL_SECONDS):
+    stop_event = threading.Event()
+    if interval <= 0:
+        return stop_event
+
+    def run():
+        while not stop_event.wait(interval):
+            try:
+                snapshots.check_for_update()
+            except Exception as e:
+                logger.error(f"Model snapshot check failed: {e}", exc_info=True)
+
+    threading.Thread(target=run, name="snapshot-watcher", daemon=True).start()
+    return stop_event
+
+def compact_ratings():
+    # Escribe una versión nueva de los artefactos que incluye los ratings que el snapshot activo
+    # aplica encima de su matriz. La escribe un solo worker; los demás la cargan con el vigilante
+    # de versiones como cualquier otra. Devuelve la versión nueva o None si no hacía falta.
+    snapshot = snapshots.active
+    if snapshot is None or not snapshot.user_item_matrix.updated_users:
+        return None
+    with artifacts_lock(DATA_PATH) as acquired:
+        # Otro worker está compactando o ya ha publicado una versión posterior
+        if not acquired or current_version(DATA_PATH) != snapshot.version:
+            return None
+        store = _get_catalog_store()
+        ratings_read_at = time.time()
+        db = ReadSessionLocal()
+        try:
+            store.refresh(db, force=True)
+        finally:
+            db.close()
+        version = snapshot.compact(store.current_ratings(), ratings_read_at)
+    logger.info(f"Compacted the ratings received since {snapshot.version} into model snapshot {version}.")
+    snapshots.reload(version, background=False)
+    # Cada compactación escribe una versión completa: se borran las antiguas que ya no usa nadie
+    with artifacts_lock(DATA_PATH) as acquired:
+        if acquired:
+            removed = prune_versions(DATA_PATH, keep=MODEL_KEEP_VERSIONS)
+            if removed:
+                logger.info(f"Removed old model snapshots: {', '.join(removed)}.")
+    return version
+
+def start_compaction_worker(interval=COMPACTION_INTERVAL_SECONDS):
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            try:
+                compact_ratings()
+            except Exception as e:
+                logger.error(f"Model compaction failed: {e}", exc_info=True)
+
+    threading.Thread(target=run, name="model-compaction", daemon=True).start()
+    return stop_event
+
+class ContentUpdater:
+    # Aplica al modelo de contenido de cada snapshot las películas nuevas o con tags nuevos,
+    # en un solo hilo propio: recalcular vecinos no ocupa el threadpool de las peticiones y
+    # los cambios se aplican en orden. Los movieIds pendientes se juntan, así muchos tags
+    # seguidos de la misma película la recalculan una vez, con el contenido más reciente.
+    def __init__(self, get_store):
+        self._get_store = get_store
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-model")
+
+    def add(self, snapshot, movie_ids):
+        if not len(movie_ids):
+            return
+        with self._lock:
+            scheduled = bool(self._pending)
+            self._pending.setdefault(snapshot, set()).update(int(movie_id) for movie_id in movie_ids)
+        if not scheduled:
+            self._executor.submit(self._run)
+
+    def wait(self):
+        # Espera a que se apliquen los cambios pendientes
+        self._executor.submit(lambda: None).result()
+
+    def _run(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        store = self._get_store()
+        for snapshot, movie_ids in pending.items():
+            try:
+                for movie_id, title, tags in store.movie_content(sorted(movie_ids)):
+                    if not snapshot.update_movie_content(movie_id, title, tags):
+                        logger.warning(f"Model version {snapshot.version} has no content vocabulary, new movies and tags will be used after the next precompute.")
+                        break
+            except Exception as e:
+                logger.error(f"Content model update failed: {e}", exc_info=True)
+
+def apply_store_content(movie_ids):
+    # Como con los ratings: CatalogStore ve las películas y tags que llegan a cualquier worker;
+    # se aplican al snapshot activo los que su precálculo no incluye
+    snapshot = snapshots.active
+    if snapshot is None:
+        return
+    content_updater.add(snapshot, np.intersect1d(movie_ids, snapshot.stale_content(_get_catalog_store())))
+
+def apply_store_ratings(ratings):
+    # CatalogStore ve todos los ratings confirmados en la base de datos, los reciba este worker
+    # u otro; los que son posteriores al precálculo se aplican al snapshot activo. Si aún no hay
+    # ninguno, se los aplicará on_load al cargarlo.
+    snapshot = snapshots.active
+    if snapshot is None:
+        return
+    for user_id in snapshot.apply_ratings(ratings):
+        recommendation_cache.invalidate_user(user_id)
+
+@lru_cache()
+def _get_catalog_store():
+    store = CatalogStore()
+    store.on_ratings(apply_store_ratings)
+    store.on_content(apply_store_content)
+    return store
+
+content_updater = ContentUpdater(_get_catalog_store)
+
+snapshots.on_load(lambda snapshot: snapshot.apply_ratings(_get_catalog_store().current_ratings(since=snapshot.ratings_since)))
+snapshots.on_load(lambda snapshot: content_updater.add(snapshot, snapshot.stale_content(_get_catalog_store())))
+
+def get_catalog_store(db: Session = Depends(get_read_db)):
+    store = _get_catalog_store()
+    store.refresh(db)
+    return store
@@ -1,10 +1,13 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from routers.auth import router as auth_router
+from routers.auth import router as auth_router, password_executor
 from routers.recommendations import router as recommendations_router
 from routers.movies import router as movies_router
+from routers.admin import router as admin_router
 from src.database import create_db_and_tables
+from dependencies import start_compaction_worker, start_snapshot_watcher, recommender_executor
 
 # Configure logging
 logging.basicConfig(
@@ -18,8 +21,20 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background compaction of ratings received through /rate
+    stop_compaction = start_compaction_worker()
+    # Picks up new precompute_data.py runs without restarting
+    stop_watcher = start_snapshot_watcher()
+    yield
+    stop_compaction.set()
+    stop_watcher.set()
+    recommender_executor.shutdown()
+    password_executor.shutdown()
+
 # Create database and tables on startup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -39,6 +54,7 @@ async def global_exception_handler(request: Request, exc: Exception):
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(recommendations_router, prefix="/recommendations", tags=["recommendations"])
 app.include_router(movies_router, prefix="", tags=["movies"])
+app.include_router(admin_router, prefix="", tags=["admin"])
 
 @app.get("/")
 def home():
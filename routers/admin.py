@@ -0,0 +1,38 @@
+import logging
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy.orm import Session
+from src.database import get_db
+from dependencies import snapshots, recommender_executor, recommendation_cache, scoring_latency
+from .auth import revoke_user_tokens, token_cache, password_executor
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+router = APIRouter()
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    # Sin ADMIN_TOKEN configurado los endpoints de administración quedan deshabilitados
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+
+@router.get("/health")
+def health():
+    return {"status": "ok", "model": snapshots.status(), "executor": recommender_executor.stats(), "scoring_latency": scoring_latency.stats(), "recommendation_cache": recommendation_cache.stats(), "token_cache": token_cache.stats(), "password_hashing": password_executor.stats()}
+
+@router.post("/admin/reload", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(verify_admin_token)])
+def reload_model(version: Optional[str] = None):
+    logger.info(f"Model reload requested (version: {version or 'CURRENT'})")
+    try:
+        target = snapshots.reload(version)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    return {"message": "Model reload started", "version": target}
+
+@router.post("/admin/users/{user_id}/revoke-tokens", dependencies=[Depends(verify_admin_token)])
+def revoke_tokens(user_id: int, db: Session = Depends(get_db)):
+    revoked = revoke_user_tokens(db, user_id)
+    logger.info(f"Revoked {revoked} tokens for user_id: {user_id}")
+    return {"message": "Tokens revoked", "revoked": revoked}
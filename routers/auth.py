@@ -1,15 +1,21 @@
+import asyncio
 import logging
 import os
+import uuid
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 import jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
 from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from src.database import get_db
 from src.models import User, Token
+from src.cache import TokenCache
+from src.executor import BoundedExecutor, ExecutorBusy
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +24,33 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Tiempo máximo que un token verificado se guarda en memoria; también limita cuánto sigue
+# valiendo aquí un token revocado desde otro proceso
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 60))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+# Coste de bcrypt (2^rounds iteraciones) de los hashes nuevos; los existentes conservan el suyo
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# El hash de contraseñas usa un pool propio y pequeño, así una avalancha de logins no deja sin
+# hilos al resto de endpoints. Con más de PASSWORD_HASH_QUEUE_SIZE peticiones en espera, 429.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 64))
+PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_TIMEOUT_SECONDS", 10))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+password_executor = BoundedExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_QUEUE_SIZE,
+    timeout=PASSWORD_HASH_TIMEOUT_SECONDS,
+    name="password-hash",
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+token_cache = TokenCache(ttl=TOKEN_CACHE_TTL, max_entries=TOKEN_CACHE_SIZE)
+
+class AuthenticatedUser:
+    # Usuario de un token; a diferencia del User del ORM, sigue valiendo después de cerrar la sesión
+    def __init__(self, id: int, username: str):
+        self.id = id
+        self.username = username
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,17 +58,32 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def run_password_task(fn, *args):
+    try:
+        return await password_executor.run(fn, *args)
+    except ExecutorBusy:
+        logger.warning("Password hashing pool is full, rejecting request.")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many authentication requests, try again later", headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        logger.error(f"Password hashing timed out after {password_executor.timeout}s.")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Authentication is temporarily unavailable")
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti hace único cada token, aunque se emitan dos al mismo usuario en el mismo segundo
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    identity = token_cache.get(token)
+    if identity is not None:
+        return identity
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,36 +97,89 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except jwt.PyJWTError as e:
         logger.error(f"Token decoding failed: {e}")
         raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+
+    user_id = payload.get("uid")
+    if user_id is not None:
+        # Los tokens emitidos están en la tabla tokens; revocar uno borra su fila
+        issued = db.query(Token.id).filter(Token.access_token == token, Token.user_id == user_id).first()
+        if issued is None:
+            logger.warning(f"Revoked or unknown token used for user_id: {user_id}")
+            raise credentials_exception
+        identity = AuthenticatedUser(user_id, username)
+    else:
+        # Tokens emitidos antes de incluir el id del usuario en los claims
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        identity = AuthenticatedUser(user.id, user.username)
+
+    token_cache.put(token, identity, payload["exp"])
+    return identity
+
+def store_token(db: Session, access_token: str, user_id: int):
+    # Guarda un token nuevo y borra los caducados del usuario
+    for row in db.query(Token).filter(Token.user_id == user_id).all():
+        try:
+            jwt.decode(row.access_token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.PyJWTError:
+            db.delete(row)
+    db.add(Token(access_token=access_token, token_type="bearer", user_id=user_id))
+    db.commit()
+
+def revoke_token(db: Session, access_token: str):
+    db.query(Token).filter(Token.access_token == access_token).delete()
+    db.commit()
+    token_cache.evict(access_token)
+
+def revoke_user_tokens(db: Session, user_id: int):
+    revoked = db.query(Token).filter(Token.user_id == user_id).delete()
+    db.commit()
+    token_cache.evict_user(user_id)
+    return revoked
 
 router = APIRouter()
 
+def _find_user(db: Session, username: str):
+    return db.query(User).filter(User.username == username).first()
+
+def _create_user(db: Session, username: str, hashed_password: str):
+    # None si otro registro con el mismo nombre se ha adelantado mientras se calculaba el hash
+    new_user = User(username=username, hashed_password=hashed_password)
+    db.add(new_user)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(new_user)
+    return new_user
+
+def _username_taken(username: str):
+    logger.warning(f"Username {username} already exists.")
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Username already registered"
+    )
+
+# register y login son async para no ocupar un hilo del servidor mientras esperan al pool de
+# hash; sus consultas a la base de datos siguen yendo al threadpool
 @router.post("/register")
-def register(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def register(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     logger.info(f"Registering user: {form_data.username}")
-    db_user = db.query(User).filter(User.username == form_data.username).first()
+    db_user = await run_in_threadpool(_find_user, db, form_data.username)
     if db_user:
-        logger.warning(f"Username {form_data.username} already exists.")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    hashed_password = get_password_hash(form_data.password)
-    new_user = User(username=form_data.username, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+        raise _username_taken(form_data.username)
+    hashed_password = await run_password_task(get_password_hash, form_data.password)
+    if await run_in_threadpool(_create_user, db, form_data.username, hashed_password) is None:
+        raise _username_taken(form_data.username)
     logger.info(f"User {form_data.username} registered successfully.")
     return {"message": "User registered successfully"}
 
 @router.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     logger.info(f"Login attempt for user: {form_data.username}")
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_find_user, db, form_data.username)
+    if not user or not await run_password_task(verify_password, form_data.password, user.hashed_password):
         logger.warning(f"Invalid login attempt for user: {form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -90,7 +188,14 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
+    await run_in_threadpool(store_token, db, access_token, user.id)
     logger.info(f"User {form_data.username} logged in successfully.")
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/logout")
+def logout(token: str = Depends(oauth2_scheme), current_user: AuthenticatedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    revoke_token(db, token)
+    logger.info(f"User {current_user.username} logged out.")
+    return {"message": "Token revoked"}
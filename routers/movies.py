@@ -1,34 +1,116 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from src.models import Movie
-from src.database import get_db
-from .auth import get_current_user, User
+from src.models import Movie, Tag
+from src.database import get_db, get_read_db
+from src.search import search_movies
+from src.cache import VersionedCache
+from src.store import CatalogStore
+from dependencies import get_catalog_store
+from .auth import get_current_user, AuthenticatedUser
+from .admin import verify_admin_token
+from .responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MOVIE_FIELDS = {"id": Movie.id, "title": Movie.title, "genres": Movie.genres}
+# El total se vuelve a contar al añadir una película (cambia el id máximo) o pasados estos segundos
+movie_count_cache = VersionedCache(ttl=float(os.getenv("MOVIES_COUNT_CACHE_TTL", 60)), max_entries=1)
+
 class MovieResponse(BaseModel):
     id: int
-    title: str
-    genres: str
+    title: Optional[str] = None
+    genres: Optional[str] = None
 
     class Config:
         orm_mode = True
 
+class MovieCreate(BaseModel):
+    title: str
+    genres: Optional[str] = None
+
+class TagCreate(BaseModel):
+    tag: str
+
 class PaginatedMovieResponse(BaseModel):
     total_count: int
     movies: List[MovieResponse]
+    next_cursor: Optional[str] = None
+
+def encode_cursor(last_id: int):
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["after"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]):
+    if not fields:
+        return list(MOVIE_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = set(names) - set(MOVIE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # El id se devuelve siempre: es a lo que apunta el cursor
+    return ["id"] + [name for name in MOVIE_FIELDS if name in names and name != "id"]
+
+def count_movies(db: Session):
+    max_id = db.query(func.max(Movie.id)).scalar()
+    return movie_count_cache.get_or_compute("movies", max_id, lambda: db.query(func.count(Movie.id)).scalar())
 
 @router.get("/movies", response_model=PaginatedMovieResponse)
-def get_all_movies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    total_count = db.query(Movie).count()
-    movies = db.query(Movie).offset(skip).limit(limit).all()
-    return {"total_count": total_count, "movies": movies}
+def get_all_movies(cursor: Optional[str] = None, skip: int = 0, limit: int = Query(100, ge=1, le=1000), fields: Optional[str] = None, db: Session = Depends(get_read_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    # Las páginas se leen por id (keyset): next_cursor da la página siguiente.
+    # `skip` se sigue aceptando en la primera petición, pero los offsets grandes son lentos.
+    names = parse_fields(fields)
+    query = db.query(*[MOVIE_FIELDS[name] for name in names]).order_by(Movie.id)
+    if cursor:
+        query = query.filter(Movie.id > decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    movies = [dict(zip(names, row)) for row in rows[:limit]]
+    # Las filas se construyen directamente con las columnas pedidas, sin un modelo Pydantic por película
+    return ORJSONResponse({"total_count": count_movies(db), "movies": movies, "next_cursor": next_cursor})
 
 @router.get("/movies/search", response_model=PaginatedMovieResponse)
-def search_movie(name: str = Query(..., min_length=3), skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    query = db.query(Movie).filter(Movie.title.contains(name))
-    total_count = query.count()
-    movies = query.offset(skip).limit(limit).all()
+def search_movie(name: str = Query(..., min_length=3), genre: Optional[str] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    total_count, movies = search_movies(db, name, genre=genre, skip=skip, limit=limit)
     return {"total_count": total_count, "movies": movies}
+
+@router.post("/movies", response_model=MovieResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(verify_admin_token)])
+def create_movie(movie: MovieCreate, db: Session = Depends(get_db), store: CatalogStore = Depends(get_catalog_store)):
+    db_movie = Movie(title=movie.title, genres=movie.genres)
+    db.add(db_movie)
+    db.commit()
+    db.refresh(db_movie)
+    # La recarga del store pasa la película al modelo de contenido en segundo plano (los demás
+    # workers, en su siguiente recarga)
+    store.refresh(db, force=True)
+    logger.info(f"Movie {db_movie.id} created.")
+    return db_movie
+
+@router.post("/movies/{movie_id}/tags", status_code=status.HTTP_201_CREATED)
+def add_tag(movie_id: int, tag: TagCreate, db: Session = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user), store: CatalogStore = Depends(get_catalog_store)):
+    movie = db.get(Movie, movie_id)
+    if movie is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    db.add(Tag(user_id=current_user.id, movie_id=movie_id, tag=tag.tag, timestamp=int(time.time())))
+    db.commit()
+    store.refresh(db, force=True)
+    logger.info(f"Tag added to movie {movie_id} by user {current_user.id}.")
+    return {"message": "Tag added successfully"}
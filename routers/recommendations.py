@@ -1,90 +1,225 @@
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+import os
+import time
+import asyncio
+import orjson
+from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from src.colaborative import get_user_recommendations
+from src.colaborative import score_user_recommendations
 from src.popularity import get_popular_movies
-from src.content import get_similar_movies
-from src.hybrid import get_hybrid_recommendations
-from dependencies import get_data_manager, PrecomputedDataManager
-from .auth import get_current_user, User
+from src.cache import VersionedCache
+from src.content import score_similar_movies
+from src.hybrid import score_hybrid_recommendations
+from src.batch import BATCH_MODELS, iter_batch_recommendations
+from src.executor import ExecutorBusy
+from dependencies import get_data_manager, get_catalog_store, PrecomputedDataManager, DATA_PATH, recommender_executor, RECOMMENDER_BATCH_TIMEOUT_SECONDS, recommendation_cache, scoring_latency, score_batch_in_process
+from .auth import get_current_user, AuthenticatedUser
+from .admin import verify_admin_token
+from .responses import ORJSONResponse
 from src.database import get_db
-from src.utils import get_data_from_db
-from src.models import Rating as RatingModel
+from src.store import CatalogStore
+from src.utils import upsert_rating
 from datetime import datetime
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+popularity_cache = VersionedCache(ttl=float(os.getenv("POPULARS_CACHE_TTL", 300)))
+# Usuarios por tarea del endpoint batch
+BATCH_CHUNK_SIZE = 1024
+# Modelos de /recommend: vecindad de usuarios o factores latentes (SVD)
+RECOMMEND_MODELS = ("collaborative", "svd")
+
+def _executor_busy():
+    logger.warning("Recommendation executor is full, rejecting request.")
+    return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many recommendation requests, try again later", headers={"Retry-After": "1"})
+
+async def run_recommender(fn, *args, **kwargs):
+    # Ejecuta el cálculo en el pool de recomendadores sin bloquear el event loop
+    try:
+        return await recommender_executor.run(fn, *args, **kwargs)
+    except ExecutorBusy:
+        raise _executor_busy()
+    except asyncio.TimeoutError:
+        logger.error(f"Recommendation computation timed out after {recommender_executor.timeout}s.")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Recommendation computation timed out")
+
+async def cached_recommendations(user_id, key, data_manager, compute):
+    # `compute` devuelve la lista de registros que se guarda en la caché
+    recs = recommendation_cache.get(user_id, key, data_manager.version)
+    if recs is None:
+        generation = recommendation_cache.generation(user_id)
+        recs = await run_recommender(compute)
+        recommendation_cache.put(user_id, key, data_manager.version, recs, generation)
+    return recs
+
+RECORD_KEYS = ("movieId", "title", "score", "source")
+
+def to_records(movie_ids, titles, scores, sources=None):
+    # Registros construidos directamente desde los arrays, sin DataFrame ni validación de
+    # Pydantic por fila; se omiten las películas que no están en el catálogo
+    columns = [movie_ids.tolist(), titles.tolist(), scores.tolist()]
+    if sources is not None:
+        columns.append(sources.tolist())
+    keys = RECORD_KEYS[:len(columns)]
+    return [dict(zip(keys, values)) for values in zip(*columns) if values[1] is not None]
+
+class Recommendation(BaseModel):
+    movieId: int
+    title: str
+    score: float
+
+class HybridRecommendation(Recommendation):
+    # "collaborative" (score = rating estimado) o "content" (score = similitud con el perfil)
+    source: str
+
 class RatingCreate(BaseModel):
     movie_id: int
     rating: float
 
+class BatchRequest(BaseModel):
+    user_ids: List[int]
+    top_n: int = 10
+    model: str = "collaborative"
+
 @router.post("/rate")
-def rate_movie(rating: RatingCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def rate_movie(rating: RatingCreate, db: Session = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user), store: CatalogStore = Depends(get_catalog_store)):
     logger.info(f"Rating submission request for movie_id: {rating.movie_id} by user_id: {current_user.id}")
     
-    db_rating = RatingModel(
-        user_id=current_user.id,
-        movie_id=rating.movie_id,
-        rating=rating.rating,
-        timestamp=int(datetime.now().timestamp())
-    )
-    
-    db.add(db_rating)
-    db.commit()
-    db.refresh(db_rating)
+    # Volver a valorar una película sustituye el rating anterior
+    upsert_rating(db, current_user.id, rating.movie_id, rating.rating, int(datetime.now().timestamp()))
+    # La recarga del store aplica el rating al modelo y borra las recomendaciones en caché del
+    # usuario (los demás workers, en su siguiente recarga)
+    store.refresh(db, force=True)
     
     logger.info(f"Rating of {rating.rating} for movie {rating.movie_id} by user {current_user.id} saved.")
     
     return {"message": "Rating submitted successfully"}
 
-@router.get("/recommend/content/{movie_id}")
-def recommend_by_content(movie_id: int, top_n: int = 10, current_user: User = Depends(get_current_user), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
+@router.get("/recommend/content/{movie_id}", response_model=List[Recommendation])
+async def recommend_by_content(movie_id: int, top_n: int = 10, current_user: AuthenticatedUser = Depends(get_current_user), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
     logger.info(f"Content recommendation request for movie_id: {movie_id}, top_n: {top_n}")
+
+    def compute():
+        content = data_manager.content
+        similar = score_similar_movies(movie_id, content.vectors, content.movie_indices, top_n=top_n, content_neighbors=content.neighbors)
+        if similar is None:
+            return None
+        positions, scores = similar
+        movies = content.movies_df
+        return to_records(movies['movieId'].to_numpy()[positions], movies['title'].to_numpy()[positions], scores)
+
     try:
-        recs = get_similar_movies(movie_id, data_manager.movies_df_content, data_manager.tfidf_matrix, data_manager.movie_indices, top_n=top_n)
+        recs = await run_recommender(compute)
+        if recs is None:
+            raise HTTPException(status_code=404, detail="Movie not found")
         logger.info(f"Content recommendations generated for movie_id: {movie_id}")
-        return recs.to_dict(orient='records')
+        return ORJSONResponse(recs)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in content recommendation for movie_id: {movie_id} - {e}")
         raise HTTPException(status_code=404, detail="Movie not found")
 
-@router.get("/recommend/hybrid")
-def recommend_hybrid(top_n: int = 10, current_user: User = Depends(get_current_user), db: Session = Depends(get_db), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
+@router.get("/recommend/hybrid", response_model=List[HybridRecommendation])
+async def recommend_hybrid(top_n: int = 10, current_user: AuthenticatedUser = Depends(get_current_user), store: CatalogStore = Depends(get_catalog_store), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
     user_id = current_user.id
     logger.info(f"Hybrid recommendation request for user_id: {user_id}, top_n: {top_n}")
     
-    movies, ratings, _ = get_data_from_db(db)
-    
-    if user_id not in data_manager.user_item_matrix.index:
+    if user_id not in data_manager.user_item_matrix:
         logger.warning(f"User with id: {user_id} not found for hybrid recommendation.")
         raise HTTPException(status_code=404, detail="User not found")
         
-    recs = get_hybrid_recommendations(user_id, movies, ratings, data_manager.user_item_matrix, data_manager.movies_df_content, data_manager.tfidf_matrix, data_manager.movie_indices, top_n=top_n)
+    def compute():
+        user_item_matrix, neighbors = data_manager.user_model(user_id)
+        content = data_manager.content
+        ids, scores, sources = score_hybrid_recommendations(user_id, store.user_ratings(user_id), user_item_matrix, neighbors, content.vectors, content.movie_indices, content.movie_ids, top_n=top_n, content_index=content.index)
+        return to_records(ids, store.titles(ids), scores, sources)
+
+    recs = await cached_recommendations(user_id, ("hybrid", top_n), data_manager, compute)
     logger.info(f"Hybrid recommendations generated for user_id: {user_id}")
-    return recs.to_dict(orient='records')
+    return ORJSONResponse(recs)
 
-@router.get("/recommend")
-def recommend(current_user: User = Depends(get_current_user), db: Session = Depends(get_db), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
+@router.get("/recommend", response_model=List[Recommendation])
+async def recommend(model: str = "collaborative", current_user: AuthenticatedUser = Depends(get_current_user), store: CatalogStore = Depends(get_catalog_store), data_manager: PrecomputedDataManager = Depends(get_data_manager)):
     user_id = current_user.id
-    logger.info(f"Collaborative filtering recommendation request for user_id: {user_id}")
-    
-    movies, _, _ = get_data_from_db(db)
+    logger.info(f"Collaborative filtering recommendation request for user_id: {user_id} (model: {model})")
 
-    if user_id not in data_manager.user_item_matrix.index:
+    if model not in RECOMMEND_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model, expected one of: {', '.join(RECOMMEND_MODELS)}")
+    if model == "svd" and data_manager.factor_model is None:
+        raise HTTPException(status_code=400, detail="The active model version has no svd factors, run precompute_data.py again")
+    
+    if user_id not in data_manager.user_item_matrix:
         logger.warning(f"User with id: {user_id} not found for collaborative recommendation.")
         raise HTTPException(status_code=404, detail="User not found")
     
-    recs = get_user_recommendations(user_id, data_manager.user_item_matrix, movies, top_n=10)
+    def compute():
+        with scoring_latency.measure(model):
+            if model == "svd":
+                user_item_matrix = data_manager.user_item_matrix
+                indices, values = user_item_matrix.user_vector(user_id)
+                ids, scores = data_manager.factor_model.recommend(user_item_matrix.movie_ids[indices], values, top_n=10)
+            else:
+                user_item_matrix, neighbors = data_manager.user_model(user_id)
+                ids, scores = score_user_recommendations(user_id, user_item_matrix, neighbors, top_n=10)
+        return to_records(ids, store.titles(ids), scores)
+
+    recs = await cached_recommendations(user_id, (model, 10), data_manager, compute)
     logger.info(f"Collaborative filtering recommendations generated for user_id: {user_id}")
-    return recs.to_dict(orient='records')
+    return ORJSONResponse(recs)
 
-@router.get("/populars")
-def populars(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    logger.info("Popular movies request")
-    movies, ratings, _ = get_data_from_db(db)
-    recs = get_popular_movies(movies, ratings, top_n=10)
+@router.get("/populars", response_model=List[Recommendation])
+async def populars(top_n: int = 10, genre: Optional[str] = None, days: Optional[int] = None, current_user: AuthenticatedUser = Depends(get_current_user), store: CatalogStore = Depends(get_catalog_store)):
+    logger.info(f"Popular movies request (top_n: {top_n}, genre: {genre}, days: {days})")
+
+    def compute():
+        # Con `days` solo cuentan los ratings recientes ("trending")
+        since = int(time.time()) - days * 86400 if days else None
+        movies, counts, sums = store.movie_aggregates(since=since)
+        return get_popular_movies(movies, counts, sums, top_n=top_n, genre=genre)
+
+    recs = await run_recommender(popularity_cache.get_or_compute, (top_n, genre, days), store.version, compute)
     logger.info("Popular movies returned")
-    return recs
\ No newline at end of file
+    return ORJSONResponse(recs)
+
+@router.post("/batch", dependencies=[Depends(verify_admin_token)])
+async def recommend_batch(request: BatchRequest, data_manager: PrecomputedDataManager = Depends(get_data_manager)):
+    logger.info(f"Batch recommendation request for {len(request.user_ids)} users (model: {request.model}, top_n: {request.top_n})")
+    if request.model not in BATCH_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model, expected one of: {', '.join(BATCH_MODELS)}")
+
+    # La respuesta empieza a enviarse antes de calcular nada, así que el 429 solo se puede dar aquí
+    if recommender_executor.is_full():
+        raise _executor_busy()
+
+    async def lines():
+        # Una línea JSON por usuario a medida que se calcula cada trozo. Con pool de procesos el
+        # scoring usa solo los datos precalculados de la versión activa (sin los ratings de /rate).
+        # Con la respuesta ya empezada los trozos esperan hueco en el pool en lugar de dar 429, y
+        # si uno falla se termina con una línea {"error": ...} para que el cliente lo sepa.
+        for start in range(0, len(request.user_ids), BATCH_CHUNK_SIZE):
+            user_ids = request.user_ids[start:start + BATCH_CHUNK_SIZE]
+            try:
+                if recommender_executor.has_process_pool:
+                    results = await recommender_executor.run_in_process(score_batch_in_process, DATA_PATH, data_manager.version, user_ids, top_n=request.top_n, model=request.model,
+                                                                        timeout=RECOMMENDER_BATCH_TIMEOUT_SECONDS, wait=True)
+                else:
+                    results = await recommender_executor.run(lambda: list(iter_batch_recommendations(data_manager, user_ids, top_n=request.top_n, model=request.model)),
+                                                             timeout=RECOMMENDER_BATCH_TIMEOUT_SECONDS, wait=True)
+            except asyncio.TimeoutError:
+                logger.error(f"Batch recommendation chunk timed out after {RECOMMENDER_BATCH_TIMEOUT_SECONDS}s, ending the stream.")
+                yield orjson.dumps({"error": "Recommendation computation timed out", "userIds": user_ids}) + b"\n"
+                return
+            except Exception:
+                logger.exception("Batch recommendation chunk failed, ending the stream.")
+                yield orjson.dumps({"error": "Recommendation computation failed", "userIds": user_ids}) + b"\n"
+                return
+            for result in results:
+                yield orjson.dumps(result) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,8 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+class ORJSONResponse(JSONResponse):
+    # Respuesta JSON codificada con orjson. Devolverla desde un handler también se salta la
+    # validación de response_model, así que es para contenido que ya son dicts/listas simples.
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
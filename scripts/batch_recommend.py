@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import time
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dependencies import DATA_PATH, PrecomputedDataManager, score_batch_in_process
+from src.artifacts import current_version
+from src.batch import BATCH_MODELS, iter_batch_recommendations
+
+# Usuarios que recibe cada tarea del pool de procesos
+TASK_SIZE = 2048
+
+def iter_results(data_path, version, user_ids, top_n, model, block_size, workers):
+    if workers <= 1:
+        data_manager = PrecomputedDataManager(data_path, version)
+        yield from iter_batch_recommendations(data_manager, user_ids, top_n=top_n, model=model, block_size=block_size)
+        return
+
+    # Cada proceso abre la misma versión de los artefactos; al estar mapeados en memoria
+    # los procesos comparten las páginas en lugar de tener cada uno una copia.
+    chunks = [user_ids[i:i + TASK_SIZE] for i in range(0, len(user_ids), TASK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map mantiene el orden de entrada, así la salida es la misma con cualquier número de workers
+        score = partial(score_batch_in_process, data_path, version, top_n=top_n, model=model, block_size=block_size)
+        for results in executor.map(score, chunks):
+            yield from results
+
+def write_jsonl(results, output):
+    total = 0
+    with open(output, "wb") as f:
+        for result in results:
+            f.write(orjson.dumps(result) + b"\n")
+            total += 1
+    return total
+
+def write_parquet(results, output, rows_per_group=100000):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("Writing Parquet requires pyarrow (pip install pyarrow).")
+        sys.exit(1)
+
+    # Formato largo: una fila por (usuario, recomendación), escrito por grupos de filas
+    schema = pa.schema([("userId", pa.int64()), ("rank", pa.int32()), ("movieId", pa.int64()), ("title", pa.string()), ("score", pa.float64())])
+    total = 0
+    rows = {name: [] for name in schema.names}
+    with pq.ParquetWriter(output, schema) as writer:
+        for result in results:
+            total += 1
+            for rank, rec in enumerate(result["recommendations"], start=1):
+                rows["userId"].append(result["userId"])
+                rows["rank"].append(rank)
+                rows["movieId"].append(rec["movieId"])
+                rows["title"].append(rec["title"])
+                rows["score"].append(rec["score"])
+            if len(rows["userId"]) >= rows_per_group:
+                writer.write_table(pa.table(rows, schema=schema))
+                rows = {name: [] for name in schema.names}
+        if rows["userId"]:
+            writer.write_table(pa.table(rows, schema=schema))
+    return total
+
+def read_user_ids(path, data_path, version):
+    if path:
+        with open(path) as f:
+            return [int(line) for line in f if line.strip()]
+    # Por defecto, todos los usuarios de la matriz usuario-item
+    return PrecomputedDataManager(data_path, version).user_item_matrix.user_ids.tolist()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score recommendations for many users from the precomputed data.")
+    parser.add_argument("--output", required=True, help="Output file, .jsonl or .parquet")
+    parser.add_argument("--users", help="File with one user id per line (default: every user in the model)")
+    parser.add_argument("--model", default="collaborative", choices=BATCH_MODELS)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--block-size", type=int, default=256, help="Users scored per matrix multiplication")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--version", help="Precomputed data version (default: CURRENT)")
+    args = parser.parse_args()
+
+    # Se fija la versión al principio para que todos los workers usen la misma
+    version = args.version or current_version(args.data_path)
+    user_ids = read_user_ids(args.users, args.data_path, version)
+    print(f"Scoring {len(user_ids)} users with model '{args.model}' (version {version}, {args.workers} workers)...")
+
+    start = time.perf_counter()
+    results = iter_results(args.data_path, version, user_ids, args.top_n, args.model, args.block_size, args.workers)
+    if args.output.endswith(".parquet"):
+        total = write_parquet(results, args.output)
+    else:
+        total = write_jsonl(results, args.output)
+    elapsed = time.perf_counter() - start
+    print(f"{total} users written to {args.output} in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} users/sec).")
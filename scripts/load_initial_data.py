@@ -1,4 +1,7 @@
+import argparse
+import time
 import pandas as pd
+from sqlalchemy import insert, text
 from sqlalchemy.orm import Session
 import sys
 import os
@@ -10,7 +13,44 @@ from src.database import SessionLocal, engine, create_db_and_tables
 from src.models import Base, Movie, User, Rating, Tag
 from routers.auth import get_password_hash
 
-def load_data():
+DATASETS_PATH = 'datasets'
+CHUNK_SIZE = 50000
+
+# Pragmas for the duration of the bulk load (SQLite only). The load is a one-off that can be
+# rerun from the CSVs, so durability is traded for speed.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-200000",
+]
+
+def bulk_insert(connection, table, chunks, columns, label):
+    # Inserts every chunk with a single executemany per chunk and reports progress
+    total = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        records = chunk.rename(columns=columns)[list(columns.values())].to_dict(orient='records')
+        connection.execute(insert(table), records)
+        total += len(records)
+        elapsed = time.perf_counter() - start
+        print(f"  {label}: {total} rows ({total / elapsed:,.0f} rows/sec)", end="\r", flush=True)
+    elapsed = time.perf_counter() - start
+    # End the progress line before the summary
+    if total:
+        print()
+    print(f"{total} {label} loaded in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/sec).")
+    return total
+
+def read_user_ids(paths, chunk_size):
+    # Unique user ids from several CSVs, reading only the userId column in chunks
+    user_ids = set()
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=['userId'], chunksize=chunk_size):
+            user_ids.update(chunk['userId'].unique().tolist())
+    return sorted(user_ids)
+
+def load_data(datasets_path=DATASETS_PATH, chunk_size=CHUNK_SIZE):
     db: Session = SessionLocal()
 
     try:
@@ -18,66 +58,71 @@ def load_data():
         if db.query(Movie).first() or db.query(User).first():
             print("Data appears to be already loaded. Aborting.")
             return
+    finally:
+        db.close()
 
-        print("Loading movies...")
-        movies_df = pd.read_csv('datasets/movies.csv')
-        for _, row in movies_df.iterrows():
-            movie = Movie(id=row['movieId'], title=row['title'], genres=row['genres'])
-            db.add(movie)
-        db.commit()
-        print(f"{len(movies_df)} movies loaded.")
-
-        print("Loading users, ratings, and tags...")
-        ratings_df = pd.read_csv('datasets/ratings.csv')
-        tags_df = pd.read_csv('datasets/tags.csv')
-
-        # Get unique users from both files
-        user_ids = pd.concat([ratings_df['userId'], tags_df['userId']]).unique()
-        hashed_password = get_password_hash("password")
-        for user_id in user_ids:
-            user = User(
-                id=int(user_id),
-                username=f"user{user_id}",
-                hashed_password=hashed_password
-            )
-            db.add(user)
-        db.commit()
-        print(f"{len(user_ids)} users loaded.")
-
-        print("Loading ratings...")
-        for _, row in ratings_df.iterrows():
-            rating = Rating(
-                user_id=row['userId'],
-                movie_id=row['movieId'],
-                rating=row['rating'],
-                timestamp=row['timestamp']
+    movies_path = os.path.join(datasets_path, 'movies.csv')
+    ratings_path = os.path.join(datasets_path, 'ratings.csv')
+    tags_path = os.path.join(datasets_path, 'tags.csv')
+    load_start = time.perf_counter()
+
+    try:
+        with engine.begin() as connection:
+            if engine.dialect.name == "sqlite":
+                for pragma in BULK_LOAD_PRAGMAS:
+                    connection.execute(text(pragma))
+
+            print("Loading movies...")
+            bulk_insert(
+                connection, Movie.__table__,
+                pd.read_csv(movies_path, chunksize=chunk_size),
+                {'movieId': 'id', 'title': 'title', 'genres': 'genres'},
+                "movies"
             )
-            db.add(rating)
-        db.commit()
-        print(f"{len(ratings_df)} ratings loaded.")
-
-        print("Loading tags...")
-        for _, row in tags_df.iterrows():
-            tag = Tag(
-                user_id=row['userId'],
-                movie_id=row['movieId'],
-                tag=row['tag'],
-                timestamp=row['timestamp']
+
+            print("Loading users...")
+            # Every seeded user shares the same password, so it is hashed only once
+            hashed_password = get_password_hash("password")
+            user_ids = read_user_ids([ratings_path, tags_path], chunk_size)
+            users = pd.DataFrame({'userId': user_ids})
+            users['username'] = "user" + users['userId'].astype(str)
+            users['hashed_password'] = hashed_password
+            bulk_insert(
+                connection, User.__table__,
+                (users.iloc[i:i + chunk_size] for i in range(0, len(users), chunk_size)),
+                {'userId': 'id', 'username': 'username', 'hashed_password': 'hashed_password'},
+                "users"
             )
-            db.add(tag)
-        db.commit()
-        print(f"{len(tags_df)} tags loaded.")
 
-        print("\nData loading complete!")
+            print("Loading ratings...")
+            bulk_insert(
+                connection, Rating.__table__,
+                pd.read_csv(ratings_path, chunksize=chunk_size),
+                {'userId': 'user_id', 'movieId': 'movie_id', 'rating': 'rating', 'timestamp': 'timestamp'},
+                "ratings"
+            )
 
+            print("Loading tags...")
+            bulk_insert(
+                connection, Tag.__table__,
+                pd.read_csv(tags_path, chunksize=chunk_size),
+                {'userId': 'user_id', 'movieId': 'movie_id', 'tag': 'tag', 'timestamp': 'timestamp'},
+                "tags"
+            )
     except Exception as e:
-        print(f"An error occurred: {e}")
-        db.rollback()
-    finally:
-        db.close()
+        # The whole load runs in one transaction, so nothing is left half loaded
+        print(f"\nAn error occurred: {e}")
+        raise
+
+    print(f"\nData loading complete in {time.perf_counter() - load_start:.2f}s!")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load the MovieLens CSVs into the database.")
+    parser.add_argument("--datasets", default=DATASETS_PATH, help="Directory containing movies.csv, ratings.csv and tags.csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows read and inserted per batch")
+    args = parser.parse_args()
+
     print("Creating database and tables...")
     create_db_and_tables()
     print("Database and tables created.")
-    load_data()
+    load_data(args.datasets, args.chunk_size)
@@ -0,0 +1,51 @@
+import sys
+import os
+from sqlalchemy import inspect, text
+
+# Add project root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import engine, create_db_and_tables
+from src.models import Rating, Tag, MOVIES_FTS_DDL
+
+# Deja solo el último rating (mayor timestamp y, después, mayor id) de cada usuario y película,
+# como exige el índice único (user_id, movie_id)
+DEDUPLICATE_RATINGS = """
+DELETE FROM ratings WHERE id NOT IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY user_id, movie_id ORDER BY timestamp DESC, id DESC
+        ) AS position
+        FROM ratings
+    ) AS ranked
+    WHERE position = 1
+)
+"""
+
+def migrate():
+    # Pone una base de datos existente al día con el esquema actual. create_all solo crea las
+    # tablas que faltan, así que los índices nuevos de tablas existentes se crean aquí. Se puede
+    # ejecutar varias veces.
+    create_db_and_tables()
+    with engine.begin() as connection:
+        existing = {table: {index["name"] for index in inspect(connection).get_indexes(table)} for table in ("ratings", "tags")}
+
+        if "uq_ratings_user_movie" not in existing["ratings"]:
+            removed = connection.execute(text(DEDUPLICATE_RATINGS)).rowcount
+            print(f"Removed {removed} duplicate ratings.")
+
+        for table in (Rating.__table__, Tag.__table__):
+            for index in table.indexes:
+                if index.name not in existing[table.name]:
+                    print(f"Creating index {index.name}...")
+                    index.create(connection)
+
+        if engine.dialect.name == "sqlite" and not inspect(connection).has_table("movies_fts"):
+            print("Creating the movie search index...")
+            for statement in MOVIES_FTS_DDL:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')"))
+    print("Database schema is up to date.")
+
+if __name__ == "__main__":
+    migrate()
@@ -1,46 +1,219 @@
+import argparse
 import os
 import sys
-import pandas as pd
-import joblib
+import time
+import numpy as np
+from scipy import sparse
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.matrix_builder import build_user_item_matrix
-from src.content import prepare_content_based
-from src.database import SessionLocal
-from src.utils import get_data_from_db
+from src.matrix_builder import build_user_item_matrix_from_chunks, build_user_neighbors, USER_NEIGHBORS_K
+from src.content import fit_content_vectorizer, build_content_embeddings, build_content_neighbors
+from src.factorization import train_item_factors, N_FACTORS
+from src.ann import build_ivf_index
+from src.artifacts import KEEP_VERSIONS, artifacts_lock, prune_versions, save_artifacts
+from src.database import ReadSessionLocal
+from src.utils import get_movies_and_tags, iter_rating_chunks
 
-def precompute_and_save():
-    db = SessionLocal()
-    movies, ratings, tags = get_data_from_db(db)
-    db.close()
+# Número de películas similares precalculadas por película para /recommend/content
+CONTENT_NEIGHBORS_K = 50
+# Filas de ratings que se leen de la base de datos en cada bloque
+RATINGS_CHUNK_SIZE = 500000
+# Películas a partir de las que se crea el índice IVF de /recommend/hybrid sin pedirlo con
+# --ann-lists: por debajo, el producto escalar con todo el catálogo es más rápido y exacto
+ANN_MIN_MOVIES = 50000
 
-    print("Building user-item matrix...")
-    user_item_matrix = build_user_item_matrix(ratings)
-    print("User-item matrix built.")
+def nbytes(matrix):
+    if sparse.issparse(matrix):
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return matrix.nbytes
 
-    print("Preparing content-based data...")
-    tfidf_matrix, movie_indices, movies_df_content = prepare_content_based(movies, tags)
-    print("Content-based data prepared.")
+def peak_memory_mb():
+    # Pico de memoria residente del proceso (ru_maxrss va en KiB en Linux y en bytes en macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
 
-    output_dir = 'precomputed_data'
-    os.makedirs(output_dir, exist_ok=True)
+def run_stage(fn, *args):
+    # Se ejecuta en el proceso de la etapa: devuelve el resultado, el tiempo y el pico de memoria
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started, peak_memory_mb()
+
+def load_ratings(chunk_size):
+    db = ReadSessionLocal()
+    try:
+        return build_user_item_matrix_from_chunks(iter_rating_chunks(db, chunksize=chunk_size))
+    finally:
+        db.close()
+
+def prepare_content():
+    db = ReadSessionLocal()
+    try:
+        movies, tags = get_movies_and_tags(db)
+    finally:
+        db.close()
+    tfidf_matrix, movies_df_content, vectorizer = fit_content_vectorizer(movies, tags)
+    return (tfidf_matrix,
+            movies_df_content['movieId'].to_numpy(dtype=np.int32),
+            movies_df_content['title'].astype(str).tolist(),
+            vectorizer.get_feature_names_out().tolist(),
+            vectorizer.idf_)
+
+class Pipeline:
+    # Ejecuta cada etapa en un proceso del pool (con workers=0, en este mismo proceso y en serie).
+    # max_tasks_per_child=1 da a cada etapa un proceso nuevo, así su pico de memoria es solo suyo.
+    def __init__(self, workers):
+        self._pool = ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) if workers > 0 else None
+        self.timings = {}
+
+    def submit(self, name, fn, *args):
+        print(f"[{name}] started")
+        if self._pool is not None:
+            return self._pool.submit(run_stage, fn, *args)
+        future = Future()
+        future.set_result(run_stage(fn, *args))
+        return future
+
+    def run(self, name, fn, *args):
+        # Etapa en el proceso principal (su resultado se necesita aquí de todas formas)
+        print(f"[{name}] started")
+        return self._finish(name, run_stage(fn, *args))
 
-    print(f"Saving user-item matrix to {output_dir}/user_item_matrix.joblib...")
-    joblib.dump(user_item_matrix, os.path.join(output_dir, 'user_item_matrix.joblib'))
-    print("User-item matrix saved.")
+    def result(self, name, future):
+        return self._finish(name, future.result())
 
-    print(f"Saving TF-IDF matrix to {output_dir}/tfidf_matrix.joblib...")
-    joblib.dump(tfidf_matrix, os.path.join(output_dir, 'tfidf_matrix.joblib'))
-    print("TF-IDF matrix saved.")
+    def _finish(self, name, stage):
+        result, elapsed, peak = stage
+        self.timings[name] = round(elapsed, 3)
+        memory = f", peak memory {peak:.0f} MB" if peak is not None else ""
+        print(f"[{name}] done in {elapsed:.1f}s{memory}")
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+def precompute_and_save(workers=3, chunk_size=RATINGS_CHUNK_SIZE, output_dir='precomputed_data', n_factors=N_FACTORS, ann_lists=None, content_dim=0, user_neighbors_k=USER_NEIGHBORS_K, keep_versions=KEEP_VERSIONS):
+    # Etapas: ratings -> matriz usuario x película -> vecinos de usuarios y factores SVD;
+    # películas y tags -> TF-IDF (-> embeddings con content_dim > 0) -> vecinos de contenido e
+    # índice IVF (solo sobre los embeddings, con ann_lists o catálogos de ANN_MIN_MOVIES películas o más).
+    # Las dos ramas son independientes:
+    # el TF-IDF se calcula en otro proceso mientras aquí se leen los ratings.
+    started = time.perf_counter()
+    # La API vuelve a aplicar los ratings, películas y tags posteriores a este momento (los que
+    # esta versión puede no tener)
+    read_at = time.time()
+    pipeline = Pipeline(workers)
+    try:
+        content = pipeline.submit("tfidf", prepare_content)
+        user_item_matrix = pipeline.run("user_item_matrix", load_ratings, chunk_size)
+        user_neighbors = pipeline.submit("user_neighbors", build_user_neighbors, user_item_matrix, user_neighbors_k)
+        item_factors = pipeline.submit("item_factors", train_item_factors, user_item_matrix, n_factors)
+
+        tfidf_matrix, content_movie_ids, content_titles, vocabulary, idf = pipeline.result("tfidf", content)
+        if content_dim > 0:
+            embeddings = pipeline.submit("content_embeddings", build_content_embeddings, tfidf_matrix, content_dim)
+            content_vectors, content_components = pipeline.result("content_embeddings", embeddings)
+        else:
+            content_vectors = tfidf_matrix
+        content_neighbors = pipeline.submit("content_neighbors", build_content_neighbors, content_vectors, CONTENT_NEIGHBORS_K)
+        content_index = None
+        if content_dim > 0 and (ann_lists is not None or len(content_movie_ids) >= ANN_MIN_MOVIES):
+            content_index = pipeline.submit("content_index", build_ivf_index, content_vectors, ann_lists)
+
+        user_neighbors = pipeline.result("user_neighbors", user_neighbors)
+        item_factors = pipeline.result("item_factors", item_factors)
+        content_neighbors = pipeline.result("content_neighbors", content_neighbors)
+        if content_index is not None:
+            content_index = pipeline.result("content_index", content_index)
+    finally:
+        pipeline.shutdown()
+
+    os.makedirs(output_dir, exist_ok=True)
 
-    print(f"Saving movie indices to {output_dir}/movie_indices.joblib...")
-    joblib.dump(movie_indices, os.path.join(output_dir, 'movie_indices.joblib'))
-    print("Movie indices saved.")
+    artifacts = {
+        'user_item_matrix': user_item_matrix.matrix,
+        'user_ids': user_item_matrix.user_ids,
+        'movie_ids': user_item_matrix.movie_ids,
+        'user_neighbors': user_neighbors,
+        # Factores de las películas del modelo "svd" (alineados con movie_ids)
+        'item_factors': item_factors,
+        'content_movie_ids': content_movie_ids,
+        'content_titles': content_titles,
+        'content_neighbor_indices': content_neighbors[0],
+        'content_neighbor_scores': content_neighbors[1],
+        # Vocabulario (término de cada columna) e IDF del TF-IDF, para vectorizar películas nuevas sin reajustarlo
+        'content_vocabulary': vocabulary,
+        'content_idf': idf,
+    }
+    if content_index is not None:
+        # Índice IVF sobre los embeddings para la parte de contenido de /recommend/hybrid
+        artifacts['content_ivf_centroids'] = content_index[0]
+        artifacts['content_ivf_offsets'] = content_index[1]
+        artifacts['content_ivf_items'] = content_index[2]
+    # Con embeddings no se guarda la matriz TF-IDF; se informa de la diferencia de tamaño
+    tfidf_bytes = nbytes(tfidf_matrix.astype(np.float32))
+    if content_dim > 0:
+        artifacts['content_embeddings'] = content_vectors
+        artifacts['content_svd_components'] = content_components
+        content_bytes = nbytes(content_vectors)
+        print(f"Content embeddings ({content_vectors.shape[1]} dimensions): {content_bytes / 2**20:.1f} MB "
+              f"instead of {tfidf_bytes / 2**20:.1f} MB for the TF-IDF matrix ({(tfidf_bytes - content_bytes) / 2**20:+.1f} MB saved)")
+    else:
+        artifacts['tfidf_matrix'] = tfidf_matrix.astype(np.float32)
+        content_bytes = tfidf_bytes
+    metadata = {
+        'user_neighbors_k': user_neighbors_k,
+        'content_neighbors_k': CONTENT_NEIGHBORS_K,
+        'n_factors': int(item_factors.shape[1]),
+        'content_ivf_lists': int(len(content_index[1]) - 1) if content_index is not None else None,
+        'content_dim': int(content_dim) if content_dim > 0 else None,
+        'content_vectors_bytes': int(content_bytes),
+        'tfidf_bytes': int(tfidf_bytes),
+        'ratings_read_at': read_at,
+        'content_read_at': read_at,
+        'n_users': int(user_item_matrix.shape[0]),
+        'n_movies': int(len(content_movie_ids)),
+        'n_ratings': int(user_item_matrix.matrix.nnz),
+        'stage_seconds': pipeline.timings,
+    }
 
-    print(f"Saving content movies DataFrame to {output_dir}/movies_df_content.joblib...")
-    joblib.dump(movies_df_content, os.path.join(output_dir, 'movies_df_content.joblib'))
-    print("Content movies DataFrame saved.")
+    print(f"Saving artifacts to {output_dir}...")
+    version_path = save_artifacts(output_dir, artifacts, metadata)
+    print(f"Artifacts saved to {version_path} and marked as current in {time.perf_counter() - started:.1f}s.")
+    # Con el cerrojo, para no podar a la vez que una compactación de la API
+    with artifacts_lock(output_dir) as acquired:
+        removed = prune_versions(output_dir, keep=keep_versions) if acquired else []
+    if removed:
+        print(f"Removed old versions: {', '.join(removed)}")
 
 if __name__ == "__main__":
-    precompute_and_save()
+    parser = argparse.ArgumentParser(description="Precompute the recommendation artifacts from the database.")
+    # Un núcleo queda para el proceso principal, que lee los ratings
+    parser.add_argument("--workers", type=int, default=min(3, (os.cpu_count() or 1) - 1),
+                        help="Processes for the independent stages (0 runs every stage in this process)")
+    parser.add_argument("--chunk-size", type=int, default=RATINGS_CHUNK_SIZE, help="Ratings read from the database per chunk")
+    parser.add_argument("--output-dir", default="precomputed_data")
+    parser.add_argument("--user-neighbors", type=int, default=USER_NEIGHBORS_K, help="Most similar users kept per user for collaborative filtering")
+    parser.add_argument("--all-neighbors", action="store_true",
+                        help="Keep every similar user (exact collaborative filtering; the neighbour matrix grows with users squared)")
+    parser.add_argument("--factors", type=int, default=N_FACTORS, help="Latent factors of the svd model")
+    parser.add_argument("--ann-lists", type=int, default=None,
+                        help=f"Build the content IVF index with this many lists (needs --content-dim; by default it is only built, with the square root of the number of movies, from {ANN_MIN_MOVIES} movies)")
+    parser.add_argument("--content-dim", type=int, default=0,
+                        help="Store the content as dense float32 embeddings of this dimension instead of the TF-IDF matrix (0 keeps TF-IDF)")
+    parser.add_argument("--keep-versions", type=int, default=KEEP_VERSIONS,
+                        help="Previous versions kept next to the new one; older ones are deleted unless an API worker still has them loaded")
+    args = parser.parse_args()
+    if args.ann_lists is not None and args.content_dim <= 0:
+        parser.error("--ann-lists needs --content-dim: the IVF index is built over the content embeddings")
+    precompute_and_save(workers=args.workers, chunk_size=args.chunk_size, output_dir=args.output_dir, n_factors=args.factors, ann_lists=args.ann_lists, content_dim=args.content_dim,
+                        user_neighbors_k=None if args.all_neighbors else args.user_neighbors, keep_versions=args.keep_versions)
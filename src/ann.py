@@ -0,0 +1,72 @@
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from src.ranking import top_k
+
+# Listas que se miran por consulta si no se indica otra cosa: más listas, más recall y más latencia
+DEFAULT_N_PROBE = 16
+
+def build_ivf_index(vectors, n_lists=None, random_state=0, block_size=4096):
+    # Índice IVF (inverted file) sobre las filas de `vectors` (dispersa o densa, normalizadas L2):
+    # k-means esférico agrupa las filas en n_lists listas y cada fila se asigna a la lista de
+    # centroide con mayor producto escalar. Devuelve (centroides, offsets, items) como arrays.
+    n_rows = vectors.shape[0]
+    n_lists = n_lists or max(int(np.sqrt(n_rows)), 1)
+    n_lists = max(min(n_lists, n_rows), 1)
+    kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=3, batch_size=block_size)
+    kmeans.fit(vectors)
+    centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+    labels = np.empty(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, block_size):
+        block = vectors[start:start + block_size] @ centroids.T
+        labels[start:start + block_size] = np.asarray(block).argmax(axis=1)
+
+    items = np.argsort(labels, kind='stable').astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+    return centroids, offsets, items
+
+class IVFIndex:
+    # Búsqueda aproximada del vecino más cercano por producto escalar: solo se puntúan las filas
+    # de las n_probe listas cuyos centroides se parecen más a la consulta, y esos candidatos se
+    # reordenan con su score exacto. Con n_probe >= n_lists el resultado es el exacto.
+    def __init__(self, centroids, offsets, items, n_probe=DEFAULT_N_PROBE):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.items = items
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self):
+        return len(self.offsets) - 1
+
+    def candidates(self, query, n_probe=None):
+        # Filas de las n_probe listas más cercanas a `query` (vector denso 1D)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        lists = top_k(self.centroids @ query, n_probe)
+        return np.concatenate([self.items[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+
+    def with_row(self, row, vector):
+        # Índice nuevo con la fila `row` (nueva o con el vector cambiado) en la lista de su
+        # centroide más cercano; los centroides no se recalculan
+        target = int(np.asarray(vector @ self.centroids.T).argmax())
+        lists = np.repeat(np.arange(self.n_lists), np.diff(self.offsets))
+        keep = self.items != row
+        items, lists = self.items[keep], lists[keep]
+        position = np.searchsorted(lists, target, side='right')
+        items = np.insert(items, position, row).astype(np.int32)
+        lists = np.insert(lists, position, target)
+        offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.n_lists), out=offsets[1:])
+        return IVFIndex(self.centroids, offsets, items, n_probe=self.n_probe)
+
+    def search(self, query, vectors, k, exclude=None, n_probe=None):
+        # (filas, scores exactos query·fila) de las k mejores filas candidatas, sin las de `exclude`
+        query = np.asarray(query, dtype=np.float32).ravel()
+        candidates = self.candidates(query, n_probe)
+        if exclude is not None and len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        scores = np.asarray(vectors[candidates] @ query).ravel()
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
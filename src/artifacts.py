@@ -0,0 +1,199 @@
+import calendar
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+import numpy as np
+from scipy import sparse
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Formato de los artefactos precalculados: un directorio por versión con un .npy por array
+# (las matrices CSR se guardan como sus tres arrays) y un manifest.json que los describe.
+# Los .npy se abren con mmap_mode='r', así que varios workers comparten las mismas páginas
+# a través de la caché del sistema operativo en lugar de tener cada uno su copia.
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+# Versiones anteriores a CURRENT que prune_versions conserva (para volver a ellas con /admin/reload)
+KEEP_VERSIONS = 3
+
+class StringArray:
+    # Lista de strings guardada como un buffer UTF-8 plano más los offsets de cada elemento
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+def new_version():
+    # Fecha UTC con microsegundos: dos versiones seguidas no se llaman igual y el orden
+    # alfabético sigue siendo el cronológico
+    now = time.time()
+    return time.strftime("v%Y%m%d%H%M%S", time.gmtime(now)) + f"{int(now * 1e6) % 1000000:06d}"
+
+def save_artifacts(base_path, artifacts, metadata=None, version=None):
+    # Escribe una versión completa en un directorio temporal y solo al final la publica
+    # (rename + actualización de CURRENT), así nunca se lee una versión a medio escribir.
+    # Una versión publicada no se sobrescribe nunca: si ya existe se lanza FileExistsError.
+    version = version or new_version()
+    final_path = os.path.join(base_path, version)
+    if os.path.exists(final_path):
+        raise FileExistsError(final_path)
+    tmp_path = os.path.join(base_path, f".tmp-{version}-{os.getpid()}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    entries = {}
+    for name, value in artifacts.items():
+        if sparse.issparse(value):
+            value = sparse.csr_matrix(value)
+            entries[name] = {
+                "type": "csr",
+                "shape": list(value.shape),
+                "files": {part: _save_array(tmp_path, f"{name}.{part}", getattr(value, part))
+                          for part in ("data", "indices", "indptr")},
+            }
+        elif isinstance(value, StringArray) or (isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value)):
+            encoded = [v.encode("utf-8") for v in value]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(v) for v in encoded], out=offsets[1:])
+            data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            entries[name] = {
+                "type": "strings",
+                "files": {"data": _save_array(tmp_path, f"{name}.data", data),
+                          "offsets": _save_array(tmp_path, f"{name}.offsets", offsets)},
+            }
+        else:
+            entries[name] = {"type": "array", "files": {"data": _save_array(tmp_path, name, np.asarray(value))}}
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "metadata": metadata or {},
+        "artifacts": entries,
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        # Sobre un directorio existente (y con contenido) el rename falla en lugar de sustituirlo
+        os.rename(tmp_path, final_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if os.path.exists(final_path):
+            raise FileExistsError(final_path)
+        raise
+    set_current_version(base_path, version)
+    return final_path
+
+def _save_array(path, name, array):
+    filename = f"{name}.npy"
+    np.save(os.path.join(path, filename), np.ascontiguousarray(array), allow_pickle=False)
+    return filename
+
+def set_current_version(base_path, version):
+    tmp_file = os.path.join(base_path, f".{CURRENT_FILE}.tmp")
+    with open(tmp_file, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp_file, os.path.join(base_path, CURRENT_FILE))
+
+@contextmanager
+def artifacts_lock(base_path):
+    # Cerrojo entre procesos (todos los workers de la API) para que solo uno escriba una versión
+    # nueva a la vez; devuelve False sin esperar si ya lo tiene otro. Sin fcntl (Windows) no bloquea.
+    if fcntl is None:
+        yield True
+        return
+    with open(os.path.join(base_path, LOCK_FILE), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def hold_version(version_path):
+    # Cerrojo compartido sobre una versión mientras este proceso la tiene mapeada: prune_versions
+    # no la borra. Se suelta al cerrar (o recolectar) el fichero devuelto.
+    f = open(os.path.join(version_path, MANIFEST_FILE))
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_SH)
+    return f
+
+def list_versions(base_path):
+    # Versiones publicadas, de la más antigua a la más reciente
+    return sorted(
+        name for name in os.listdir(base_path)
+        if name.startswith("v") and os.path.isfile(os.path.join(base_path, name, MANIFEST_FILE))
+    )
+
+def prune_versions(base_path, keep=KEEP_VERSIONS):
+    # Borra las versiones que no son CURRENT ni una de las `keep` más recientes, salvo las que
+    # algún proceso tiene abiertas (hold_version). Devuelve las versiones borradas.
+    current = current_version(base_path)
+    versions = [version for version in list_versions(base_path) if version != current]
+    removed = []
+    for version in versions[:max(len(versions) - keep, 0)]:
+        version_path = os.path.join(base_path, version)
+        with open(os.path.join(version_path, MANIFEST_FILE)) as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+            shutil.rmtree(version_path)
+        removed.append(version)
+    return removed
+
+def manifest_timestamp(manifest):
+    # created_at del manifest como timestamp Unix
+    return calendar.timegm(time.strptime(manifest["created_at"], "%Y-%m-%dT%H:%M:%SZ"))
+
+def current_version(base_path):
+    with open(os.path.join(base_path, CURRENT_FILE)) as f:
+        return f.read().strip()
+
+def load_artifacts(version_path, mmap_mode="r"):
+    with open(os.path.join(version_path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {manifest.get('format')} in {version_path}")
+
+    def load(filename):
+        path = os.path.join(version_path, filename)
+        try:
+            return np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        except ValueError:
+            # Los arrays vacíos no se pueden mapear en memoria
+            return np.load(path, allow_pickle=False)
+
+    artifacts = {}
+    for name, entry in manifest["artifacts"].items():
+        files = entry["files"]
+        if entry["type"] == "csr":
+            artifacts[name] = sparse.csr_matrix(
+                (load(files["data"]), load(files["indices"]), load(files["indptr"])),
+                shape=tuple(entry["shape"]), copy=False
+            )
+        elif entry["type"] == "strings":
+            artifacts[name] = StringArray(load(files["data"]), load(files["offsets"]))
+        else:
+            artifacts[name] = load(files["data"])
+    return manifest, artifacts
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from src.hybrid import score_hybrid_recommendations
+from src.ranking import top_k_rows
+
+BATCH_MODELS = ("collaborative", "hybrid")
+
+def iter_batch_recommendations(data_manager, user_ids, top_n=10, model="collaborative", block_size=256):
+    # Genera {"userId", "recommendations": [...]} para cada usuario, en el mismo orden que user_ids.
+    # Los usuarios sin ratings se devuelven con la lista vacía.
+    if model not in BATCH_MODELS:
+        raise ValueError(f"Unknown batch model: {model}")
+
+    for start in range(0, len(user_ids), block_size):
+        block = list(user_ids[start:start + block_size])
+        known = [user_id for user_id in block if user_id in data_manager.user_item_matrix]
+        if model == "collaborative":
+            recs = _collaborative_block(data_manager, known, top_n)
+        else:
+            recs = {user_id: _hybrid_for_user(data_manager, user_id, top_n) for user_id in known}
+        for user_id in block:
+            yield {"userId": int(user_id), "recommendations": recs.get(user_id, [])}
+
+def _collaborative_block(data_manager, user_ids, top_n):
+    # Misma ponderación que get_user_recommendations, pero con una sola multiplicación
+    # (usuarios del bloque x usuarios) @ (usuarios x películas) para todo el bloque
+    if not user_ids:
+        return {}
+    user_item_matrix, neighbors = data_manager.user_block(user_ids)
+
+    scores = (neighbors @ user_item_matrix.matrix).toarray()
+    sim_totals = np.asarray(abs(neighbors).sum(axis=1)).ravel()
+    has_neighbors = sim_totals > 0
+    scores[has_neighbors] /= sim_totals[has_neighbors, None]
+
+    # Descartar las películas que cada usuario ya ha visto
+    for row, user_id in enumerate(user_ids):
+        seen, _ = user_item_matrix.user_vector(user_id)
+        scores[row, seen] = -np.inf
+
+    top = top_k_rows(scores, top_n)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    top_movie_ids = user_item_matrix.movie_ids[top]
+    # Títulos de todo el bloque con una sola búsqueda
+    top_titles = _titles(data_manager, top_movie_ids.ravel()).reshape(top.shape)
+
+    recs = {}
+    for row, user_id in enumerate(user_ids):
+        valid = np.isfinite(top_scores[row])
+        recs[user_id] = _records(top_movie_ids[row, valid], top_titles[row, valid], top_scores[row, valid])
+    return recs
+
+def _hybrid_for_user(data_manager, user_id, top_n):
+    # Los ratings del usuario salen de la matriz usuario-item, no de la base de datos
+    user_item_matrix, neighbors = data_manager.user_model(user_id)
+    indices, values = user_item_matrix.user_vector(user_id)
+    user_ratings = pd.DataFrame({'movieId': user_item_matrix.movie_ids[indices], 'rating': values})
+    content = data_manager.content
+    movie_ids, scores, _ = score_hybrid_recommendations(
+        user_id, user_ratings, user_item_matrix, neighbors, content.vectors,
+        content.movie_indices, content.movie_ids, top_n=top_n, content_index=content.index
+    )
+    return _records(movie_ids, _titles(data_manager, movie_ids), scores)
+
+def _titles(data_manager, movie_ids):
+    # Título de cada movieId (None si no está en el catálogo de contenido)
+    content = data_manager.content
+    rows, found = content.movie_indices.rows(movie_ids)
+    titles = np.full(len(movie_ids), None, dtype=object)
+    titles[found] = content.movies_df['title'].to_numpy()[rows]
+    return titles
+
+def _records(movie_ids, titles, scores):
+    return [
+        {"movieId": movie_id, "title": title, "score": score}
+        for movie_id, title, score in zip(movie_ids.tolist(), titles.tolist(), scores.tolist())
+    ]
@@ -0,0 +1,176 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+class VersionedCache:
+    # Resultados en memoria (p. ej. de /populars). Una entrada caduca pasado `ttl` o cuando cambia
+    # la versión de los datos con los que se calculó (p. ej. porque ha llegado un rating nuevo).
+    def __init__(self, ttl=300.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_compute(self, key, version, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == version and now - entry[1] < self.ttl:
+            return entry[2]
+
+        result = compute()
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._entries[key] = (version, now, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class RecommendationCache:
+    # Resultados de /recommend y /recommend/hybrid por usuario, en LRU acotado por memoria
+    # (tamaño aproximado de los resultados guardados) y con caducidad `ttl`.
+    # - Los ratings nuevos de un usuario invalidan solo sus entradas (invalidate_user).
+    # - Al cambiar la versión del modelo se vacía entero (clear). Además cada entrada lleva
+    #   la versión con la que se calculó y solo se sirve a peticiones de esa misma versión.
+    # Un resultado que se empezó a calcular antes de invalidar al usuario no se guarda.
+    def __init__(self, ttl=300.0, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._generations = {}
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, key, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None or entry[1] != version or now - entry[2] >= self.ttl:
+                if entry is not None:
+                    self._remove((user_id, key))
+                self.misses += 1
+                return None
+            self._entries.move_to_end((user_id, key))
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, user_id):
+        # Se toma antes de calcular y se pasa a put()
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def put(self, user_id, key, version, value, generation):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generations.get(user_id, 0):
+                return
+            if (user_id, key) in self._entries:
+                self._remove((user_id, key))
+            self._entries[(user_id, key)] = (value, version, time.monotonic(), size)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in self._user_keys.get(user_id, set()).copy():
+                self._remove((user_id, key))
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, entry_key):
+        size = self._entries.pop(entry_key)[3]
+        self.size_bytes -= size
+        user_id, key = entry_key
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+def _estimate_size(value):
+    # Tamaño aproximado de una lista de registros (dicts de valores simples)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + _estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+class TokenCache:
+    # Tokens ya verificados -> identidad del usuario, para no ir a la base de datos en cada
+    # petición. Una entrada dura hasta el `exp` del token o `ttl` segundos, lo que llegue antes:
+    # el ttl acota lo que tarda un proceso en enterarse de una revocación hecha en otro.
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or time.time() >= entry[1]:
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, identity, expires_at):
+        with self._lock:
+            self._entries[token] = (identity, min(expires_at, time.time() + self.ttl))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for token in [token for token, (identity, _) in self._entries.items() if identity.id == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
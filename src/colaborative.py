@@ -1,20 +1,23 @@
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+import pandas as pd
+from src.ranking import top_k
 
-def get_user_recommendations(user_id, user_item_matrix, movies, top_n=10):
-    # Similitud entre usuarios
-    user_sim = cosine_similarity(user_item_matrix)
-    user_idx = user_item_matrix.index.get_loc(user_id)
-
-    sim_scores = user_sim[user_idx]
-    sim_users = np.argsort(sim_scores)[::-1][1:]
-
+def score_user_recommendations(user_id, user_item_matrix, neighbors, top_n=10):
+    # Devuelve (movieIds, scores) de las top_n recomendaciones, sin construir DataFrames.
+    # `neighbors` es la fila dispersa (1 x usuarios) con la similitud del usuario con sus vecinos
     # Ponderar los ratings de otros usuarios similares
-    weighted_ratings = user_item_matrix.iloc[sim_users].T.dot(sim_scores[sim_users])
-    weighted_ratings /= np.array([np.abs(sim_scores[sim_users]).sum()])
+    weighted_ratings = (neighbors @ user_item_matrix.matrix).toarray().ravel()
+    sim_total = np.abs(neighbors.data).sum()
+    if sim_total > 0:
+        weighted_ratings /= sim_total
 
-    user_seen = user_item_matrix.loc[user_id][user_item_matrix.loc[user_id] > 0].index
-    recs = weighted_ratings.drop(user_seen).sort_values(ascending=False).head(top_n)
+    # Descartar las películas que el usuario ya ha visto
+    user_seen, _ = user_item_matrix.user_vector(user_id)
+    recs = top_k(weighted_ratings, top_n, exclude=user_seen)
+    return user_item_matrix.movie_ids[recs], weighted_ratings[recs]
 
-    rec_movies = movies[movies['movieId'].isin(recs.index)]
-    return rec_movies[['movieId', 'title']]
\ No newline at end of file
+def get_user_recommendations(user_id, user_item_matrix, neighbors, movies, top_n=10):
+    rec_ids, scores = score_user_recommendations(user_id, user_item_matrix, neighbors, top_n=top_n)
+    rec_movies = movies.set_index('movieId').reindex(rec_ids).reset_index()
+    rec_movies['score'] = scores
+    return rec_movies.dropna(subset=['title'])[['movieId', 'title', 'score']]
@@ -1,8 +1,52 @@
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
+from sklearn.preprocessing import normalize
+import numpy as np
 import pandas as pd
+from scipy import sparse
+from src.ranking import top_k, top_k_rows
 
-def prepare_content_based(movies, tags):
+class MovieIndex:
+    # movieId -> fila de la matriz TF-IDF mediante búsqueda binaria sobre un array de ids
+    # (sirve tanto para arrays en memoria como mapeados desde disco)
+    def __init__(self, movie_ids):
+        self.movie_ids = movie_ids
+        self._order = np.argsort(movie_ids, kind='stable')
+        self._sorted_ids = np.asarray(movie_ids)[self._order]
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def _find(self, movie_id):
+        pos = np.searchsorted(self._sorted_ids, movie_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == movie_id:
+            return int(self._order[pos])
+        return None
+
+    def rows(self, movie_ids):
+        # Versión vectorizada de __getitem__: (filas de los movieIds que están, máscara de los que están)
+        movie_ids = np.asarray(movie_ids)
+        positions = np.searchsorted(self._sorted_ids, movie_ids)
+        positions[positions >= len(self._sorted_ids)] = 0
+        found = self._sorted_ids[positions] == movie_ids if len(self._sorted_ids) else np.zeros(len(movie_ids), dtype=bool)
+        return self._order[positions[found]], found
+
+    def __contains__(self, movie_id):
+        return self._find(movie_id) is not None
+
+    def __getitem__(self, movie_id):
+        idx = self._find(movie_id)
+        if idx is None:
+            raise KeyError(movie_id)
+        return idx
+
+def content_text(title, tags):
+    # Texto de una película para el TF-IDF: el título seguido de sus tags
+    return title + " " + " ".join(tags)
+
+def fit_content_vectorizer(movies, tags):
+    # Devuelve (matriz TF-IDF, movies_df con la columna "content", vectorizador ajustado)
     # Juntamos títulos con los tags por movieId
     tags_grouped = tags.groupby("movieId")["tag"].apply(lambda x: " ".join(x)).reset_index()
     movies_df = pd.merge(movies, tags_grouped, on="movieId", how="left")
@@ -11,18 +55,153 @@ def prepare_content_based(movies, tags):
 
     tfidf = TfidfVectorizer(stop_words='english')
     tfidf_matrix = tfidf.fit_transform(movies_df["content"])
+    return tfidf_matrix, movies_df, tfidf
+
+def prepare_content_based(movies, tags):
+    tfidf_matrix, movies_df, _ = fit_content_vectorizer(movies, tags)
     movie_indices = pd.Series(movies_df.index, index=movies_df['movieId'])
     
     return tfidf_matrix, movie_indices, movies_df
 
-def get_similar_movies(movie_id, movies_df, tfidf_matrix, movie_indices, top_n=10):
+class ContentVectorizer:
+    # Vectoriza películas nuevas igual que en el precálculo, sin reajustar nada: TF-IDF con el
+    # vocabulario y el IDF guardados y, si el contenido se guardó como embeddings, la misma
+    # proyección LSA (components). Las palabras que no estaban en el vocabulario se ignoran
+    # hasta el siguiente precálculo.
+    def __init__(self, vocabulary, idf, components=None):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.components = components
+        self._tfidf = None
+
+    def transform(self, texts):
+        if self._tfidf is None:
+            tfidf = TfidfVectorizer(stop_words='english', vocabulary={term: i for i, term in enumerate(self.vocabulary)})
+            tfidf.idf_ = np.asarray(self.idf, dtype=np.float64)
+            self._tfidf = tfidf
+        vectors = self._tfidf.transform(texts)
+        if self.components is None:
+            return vectors.astype(np.float32)
+        return normalize(np.asarray(vectors @ self.components.T)).astype(np.float32)
+
+def build_content_embeddings(tfidf_matrix, n_components=128, random_state=0):
+    # LSA: proyecta las filas TF-IDF (vocabulario sin límite) a n_components dimensiones con una
+    # SVD truncada. Se normalizan (L2) aquí, así la similitud coseno es un producto escalar denso
+    # en float32 y el resto del código las usa igual que la matriz TF-IDF.
+    n_components = max(min(n_components, min(tfidf_matrix.shape) - 1), 1)
+    # Devuelve (embeddings, components); components proyecta filas TF-IDF nuevas (ContentVectorizer)
+    svd = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=random_state)
+    embeddings = normalize(svd.fit_transform(tfidf_matrix))
+    return np.ascontiguousarray(embeddings, dtype=np.float32), svd.components_.astype(np.float32)
+
+def build_content_neighbors(tfidf_matrix, k=50, block_size=1024):
+    # Tabla con las k películas más similares de cada película (posiciones en tfidf_matrix)
+    # y su similitud, ordenadas de mayor a menor. Se calcula por bloques de filas.
+    n_movies = tfidf_matrix.shape[0]
+    k = max(min(k, n_movies - 1), 0)
+    neighbor_indices = np.empty((n_movies, k), dtype=np.int32)
+    neighbor_scores = np.empty((n_movies, k), dtype=np.float32)
+
+    if k == 0:
+        return neighbor_indices, neighbor_scores
+
+    for start in range(0, n_movies, block_size):
+        stop = min(start + block_size, n_movies)
+        neighbor_indices[start:stop], neighbor_scores[start:stop] = _neighbor_rows(tfidf_matrix, np.arange(start, stop), k)
+
+    return neighbor_indices, neighbor_scores
+
+def _neighbor_rows(vectors, rows, k):
+    # Vecinos (posiciones y similitudes) de las películas `rows` frente a todo el catálogo
+    sims = linear_kernel(vectors[rows], vectors)
+    # La propia película no cuenta como vecina
+    sims[np.arange(len(rows)), rows] = -np.inf
+    top = top_k_rows(sims, k)
+    return top, np.take_along_axis(sims, top, axis=1)
+
+class ContentModel:
+    # Todo lo que usan las recomendaciones de contenido de una versión: ids y títulos de las
+    # películas, sus vectores, la tabla de vecinos, el índice IVF (opcional) y el vectorizador.
+    # No se modifica: with_movie devuelve un modelo nuevo, así cada petición usa uno coherente.
+    def __init__(self, movie_ids, titles, vectors, neighbors, index=None, vectorizer=None):
+        self.movies_df = pd.DataFrame({"movieId": movie_ids, "title": titles})
+        self.movie_ids = self.movies_df["movieId"].to_numpy()
+        self.movie_indices = MovieIndex(self.movie_ids)
+        self.vectors = vectors
+        self.neighbors = neighbors
+        self.index = index
+        self.vectorizer = vectorizer
+
+    def with_movie(self, movie_id, title, tags, block_size=1024):
+        # Modelo con la película añadida (o con su vector recalculado si ya estaba) sin reajustar
+        # el TF-IDF: solo se recalculan los vecinos de la propia película y de las películas en
+        # cuya lista entra o estaba, por bloques de block_size filas. El coste es lineal en el
+        # catálogo (un producto y copiar arrays). Si nada cambia devuelve el mismo modelo.
+        vector = self.vectorizer.transform([content_text(title, tags)]).astype(self.vectors.dtype)
+        titles = self.movies_df["title"].to_numpy()
+        indices, scores = self.neighbors
+        if movie_id in self.movie_indices:
+            pos = self.movie_indices[movie_id]
+            if titles[pos] == title and _same_row(self.vectors[pos:pos + 1], vector):
+                return self
+            movie_ids = self.movie_ids
+            titles = titles.copy()
+            titles[pos] = title
+            vectors = _stack_rows([self.vectors[:pos], vector, self.vectors[pos + 1:]])
+            indices, scores = indices.copy(), scores.copy()
+            affected = (indices == pos).any(axis=1)
+        else:
+            pos = len(self.movie_ids)
+            movie_ids = np.append(self.movie_ids, movie_id)
+            titles = np.append(titles, title)
+            vectors = _stack_rows([self.vectors, vector])
+            k = indices.shape[1]
+            indices = np.vstack([indices, np.zeros((1, k), dtype=indices.dtype)])
+            scores = np.vstack([scores, np.full((1, k), -np.inf, dtype=scores.dtype)])
+            affected = np.zeros(len(movie_ids), dtype=bool)
+
+        k = indices.shape[1]
+        if k > 0:
+            # Películas cuya lista cambia: la nueva supera a su k-ésima vecina o ya estaba en ella
+            sims = np.asarray(linear_kernel(vector, vectors)).ravel()
+            affected |= sims > scores[:, -1]
+            affected[pos] = True
+            rows = np.flatnonzero(affected)
+            for start in range(0, len(rows), block_size):
+                block = rows[start:start + block_size]
+                indices[block], scores[block] = _neighbor_rows(vectors, block, k)
+
+        index = self.index.with_row(pos, vector) if self.index is not None else None
+        return ContentModel(movie_ids, titles, vectors, (indices, scores), index, self.vectorizer)
+
+def _same_row(row, vector):
+    if sparse.issparse(row):
+        return (row != vector).nnz == 0
+    return np.array_equal(row, vector)
+
+def _stack_rows(blocks):
+    if sparse.issparse(blocks[1]):
+        return sparse.vstack(blocks, format='csr')
+    return np.vstack(blocks)
+
+def score_similar_movies(movie_id, tfidf_matrix, movie_indices, top_n=10, content_neighbors=None):
+    # Devuelve (posiciones en movies_df_content, similitudes); None si la película no existe
     if movie_id not in movie_indices:
-        return pd.DataFrame()
+        return None
 
     idx = movie_indices[movie_id]
-    cosine_similarities = linear_kernel(tfidf_matrix[idx], tfidf_matrix).flatten()
-    sim_scores = list(enumerate(cosine_similarities))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:top_n+1]
-    movie_indices_similar = [i[0] for i in sim_scores]
-    similar_movies = movies_df.iloc[movie_indices_similar][['movieId', 'title']]
-    return similar_movies
\ No newline at end of file
+    if content_neighbors is not None and top_n <= content_neighbors[0].shape[1]:
+        # Consulta directa en la tabla de vecinos precalculada
+        return content_neighbors[0][idx, :top_n], content_neighbors[1][idx, :top_n]
+    cosine_similarities = linear_kernel(tfidf_matrix[idx:idx + 1], tfidf_matrix).flatten()
+    movie_indices_similar = top_k(cosine_similarities, top_n, exclude=[idx])
+    return movie_indices_similar, cosine_similarities[movie_indices_similar]
+
+def get_similar_movies(movie_id, movies_df, tfidf_matrix, movie_indices, top_n=10, content_neighbors=None):
+    similar = score_similar_movies(movie_id, tfidf_matrix, movie_indices, top_n=top_n, content_neighbors=content_neighbors)
+    if similar is None:
+        return pd.DataFrame()
+    movie_indices_similar, scores = similar
+    similar_movies = movies_df.iloc[movie_indices_similar][['movieId', 'title']].copy()
+    similar_movies['score'] = scores
+    return similar_movies
@@ -1,14 +1,63 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.ext.declarative import declarative_base
 
-DATABASE_URL = "sqlite:///./recommendations.db"
+# Cualquier URL de SQLAlchemy (p. ej. postgresql://...); por defecto el fichero SQLite local
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./recommendations.db")
+# Opcional: réplica para las lecturas
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+# Ajustes de SQLite: espera ante bloqueos, caché de páginas (KiB) y tamaño del mmap (bytes)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False} # Needed for SQLite
-)
+def create_db_engine(url=DATABASE_URL, read_only=False):
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
+
+    if url.database in (None, "", ":memory:"):
+        # Una base en memoria solo existe dentro de su conexión: todos comparten la misma
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},  # Needed for SQLite
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Con WAL los lectores no se bloquean con la escritura de /rate ni al revés
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+    return engine
+
+# Conexiones de escritura y de solo lectura por separado: las lecturas (catálogo, películas,
+# precompute) no ocupan las conexiones que usan los ratings
+engine = create_db_engine(DATABASE_URL)
+if DATABASE_READ_URL == DATABASE_URL and isinstance(engine.pool, StaticPool):
+    read_engine = engine
+else:
+    read_engine = create_db_engine(DATABASE_READ_URL, read_only=True)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
@@ -21,4 +70,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
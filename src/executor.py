@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+# Cada cuánto se vuelve a mirar si hay hueco cuando la tarea espera en lugar de rechazarse
+SLOT_POLL_SECONDS = 0.01
+
+class ExecutorBusy(Exception):
+    pass
+
+class BoundedExecutor:
+    # Pool propio para un tipo de trabajo pesado (recomendadores, bcrypt), separado del
+    # threadpool de Starlette para que unas cuantas peticiones lentas no dejen sin hilos al resto.
+    # El trabajo de NumPy/SciPy y bcrypt suelta el GIL, así que basta con hilos; el pool de
+    # procesos (opcional) es para código en Python puro, que con hilos no se paraleliza.
+    # Como mucho hay max_workers tareas ejecutándose y max_queue esperando: si no cabe
+    # ninguna más se lanza ExecutorBusy en lugar de encolar sin límite (o, con wait=True, se
+    # espera a que quede un hueco). timeout=0 quita el límite de tiempo de la tarea.
+    def __init__(self, max_workers=4, max_queue=32, timeout=10.0, process_workers=0, name="executor"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.process_workers = process_workers
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._processes = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # Tiempo total en cola (desde que se acepta hasta que empieza) y ejecutándose
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def has_process_pool(self):
+        return self.process_workers > 0
+
+    def is_full(self):
+        return self._pending >= self.max_workers + self.max_queue
+
+    async def run(self, fn, *args, timeout=None, wait=False, **kwargs):
+        return await self._submit(self._threads, fn, args, kwargs, timeout, wait)
+
+    async def run_in_process(self, fn, *args, timeout=None, wait=False, **kwargs):
+        # Sin procesos configurados se ejecuta en el pool de hilos
+        if not self.has_process_pool:
+            return await self.run(fn, *args, timeout=timeout, wait=wait, **kwargs)
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+        return await self._submit(self._processes, fn, args, kwargs, timeout, wait)
+
+    async def _acquire(self, wait):
+        while True:
+            with self._lock:
+                if not self.is_full():
+                    self._pending += 1
+                    return
+                if not wait:
+                    self.rejected += 1
+                    raise ExecutorBusy()
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+
+    async def _submit(self, pool, fn, args, kwargs, timeout, wait):
+        await self._acquire(wait)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            future = pool.submit(_timed, partial(fn, *args, **kwargs), time.monotonic())
+        except BaseException:
+            self._release(None)
+            raise
+        # El hueco se libera cuando la tarea termina de verdad, no cuando vence el timeout:
+        # un hilo no se puede interrumpir y sigue ocupado hasta acabar.
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout or None)
+            return result[0]
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future is not None and not future.cancelled() and future.exception() is None:
+                _, queued, elapsed = future.result()
+                self.completed += 1
+                self.queue_seconds += queued
+                self.max_queue_seconds = max(self.max_queue_seconds, queued)
+                self.run_seconds += elapsed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "process_workers": self.process_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_queue_ms": 1000 * self.queue_seconds / self.completed if self.completed else 0.0,
+                "max_queue_ms": 1000 * self.max_queue_seconds,
+                "avg_run_ms": 1000 * self.run_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+def _timed(fn, submitted):
+    # Se ejecuta en el worker (hilo o proceso): devuelve el resultado, el tiempo en cola y el de ejecución
+    started = time.monotonic()
+    result = fn()
+    return result, started - submitted, time.monotonic() - started
@@ -0,0 +1,46 @@
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from src.ranking import top_k
+
+# Dimensión de los vectores latentes de usuarios y películas
+N_FACTORS = 64
+
+def train_item_factors(user_item_matrix, n_factors=N_FACTORS, n_iter=5, random_state=0):
+    # SVD truncada de la matriz usuario x película (PureSVD): devuelve la matriz de factores de
+    # las películas (películas x n_factors, float32), alineada con user_item_matrix.movie_ids
+    n_users, n_movies = user_item_matrix.shape
+    n_factors = max(min(n_factors, n_users - 1, n_movies - 1), 1)
+    svd = TruncatedSVD(n_components=n_factors, algorithm='randomized', n_iter=n_iter, random_state=random_state)
+    svd.fit(user_item_matrix.matrix)
+    return np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+class FactorModel:
+    # Recomendador por factores latentes. El vector de un usuario se obtiene proyectando sus
+    # ratings sobre los factores de las películas (fold-in), así que sirve también para usuarios
+    # y ratings nuevos sin reentrenar, y puntuar todo el catálogo es un solo producto
+    # (películas x n_factors) @ (n_factors) en float32.
+    def __init__(self, item_factors, movie_ids):
+        self.item_factors = item_factors
+        self.movie_ids = np.asarray(movie_ids)
+
+    @property
+    def n_factors(self):
+        return self.item_factors.shape[1]
+
+    def _positions(self, movie_ids):
+        # Filas de item_factors de cada movieId; las películas posteriores al entrenamiento no tienen
+        positions = np.searchsorted(self.movie_ids, movie_ids)
+        positions[positions >= len(self.movie_ids)] = 0
+        found = self.movie_ids[positions] == movie_ids if len(self.movie_ids) else np.zeros(len(movie_ids), dtype=bool)
+        return positions[found], found
+
+    def user_vector(self, movie_ids, ratings):
+        positions, found = self._positions(np.asarray(movie_ids))
+        return np.asarray(ratings, dtype=np.float32)[found] @ self.item_factors[positions]
+
+    def recommend(self, movie_ids, ratings, top_n=10):
+        # (movieIds, scores) de las top_n películas para el usuario con esos ratings, sin las vistas
+        positions, _ = self._positions(np.asarray(movie_ids))
+        scores = self.item_factors @ self.user_vector(movie_ids, ratings)
+        recs = top_k(scores, top_n, exclude=positions)
+        return self.movie_ids[recs], scores[recs]
@@ -1,49 +1,64 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from src.content import get_similar_movies
-from src.colaborative import get_user_recommendations
+from src.colaborative import score_user_recommendations
+from src.content import MovieIndex
+from src.ranking import top_k
 
-def get_hybrid_recommendations(user_id, movies, ratings, matrix, movies_df_content, tfidf_matrix, movie_indices, top_n=10):
+def score_hybrid_recommendations(user_id, user_ratings, matrix, neighbors, tfidf_matrix, movie_indices, content_movie_ids, top_n=10, content_index=None):
+    # Devuelve (movieIds, scores, sources). El score es el de la estrategia que aporta cada
+    # película: rating estimado si es colaborativa, similitud con el perfil si es de contenido.
+    # `tfidf_matrix` son los vectores de contenido: la matriz TF-IDF dispersa o los embeddings
+    # densos de build_content_embeddings. Con `content_index` (IVFIndex sobre sus filas) la parte de contenido solo
+    # compara el perfil con las películas de las listas más cercanas en lugar de con todas; solo
+    # compensa con catálogos grandes, con pocos miles de películas el producto con todas es más rápido.
     # --- Estrategia Híbrida Mejorada ---
     # 1. Obtener recomendaciones colaborativas (como antes)
-    collab_recs = get_user_recommendations(user_id, matrix, movies, top_n=top_n*2) # Pedimos más para tener margen
+    collab_ids, collab_scores = score_user_recommendations(user_id, matrix, neighbors, top_n=top_n*2) # Pedimos más para tener margen
+    ids, scores = [collab_ids], [collab_scores]
+    sources = [np.full(len(collab_ids), "collaborative", dtype=object)]
 
     # 2. Crear un "perfil de gusto" del usuario para recomendaciones de contenido
-    user_ratings = ratings[ratings['userId'] == user_id]
-    if user_ratings.empty:
-        # Si no hay ratings, no podemos generar recomendaciones de contenido.
-        # Devolvemos solo las colaborativas si existen, o un DataFrame vacío.
-        return collab_recs.head(top_n)
-    
-    # Obtener las películas que el usuario ha calificado positivamente (e.g., > 3.5)
-    liked_movies_ids = user_ratings[user_ratings['rating'] > 3.5]['movieId']
-    
-    # Filtrar solo las películas que están en nuestros datos de contenido
-    liked_movie_indices = [movie_indices[movie_id] for movie_id in liked_movies_ids if movie_id in movie_indices]
+    # Si no hay ratings, no podemos generar recomendaciones de contenido y
+    # devolvemos solo las colaborativas si existen.
+    if not user_ratings.empty:
+        # Filas de contenido de las películas vistas (las que no están en nuestros datos de
+        # contenido se descartan) y, entre ellas, las calificadas positivamente (e.g., > 3.5)
+        seen_movie_indices, found = movie_indices.rows(user_ratings['movieId'].to_numpy())
+        liked_movie_indices = seen_movie_indices[user_ratings['rating'].to_numpy()[found] > 3.5]
 
-    content_recs = pd.DataFrame() # Inicializamos por si no hay películas que le gusten
-    if liked_movie_indices:
-        # Crear el perfil del usuario promediando los vectores TF-IDF de las películas que le gustaron
-        user_profile = np.asarray(np.mean(tfidf_matrix[liked_movie_indices], axis=0))
-        
-        # Calcular la similitud del coseno entre el perfil del usuario y todas las películas
-        cosine_similarities = cosine_similarity(user_profile, tfidf_matrix)
-        
-        # Obtener los índices de las películas más similares
-        sim_scores = list(enumerate(cosine_similarities[0]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        
-        # Obtener los top_n resultados (excluyendo las que ya ha visto)
-        movie_indices_rec = [i[0] for i in sim_scores[1:top_n*2+1]]
-        
-        # Mapear índices a movieIds y obtener títulos
-        recommended_movie_ids = movies_df_content['movieId'].iloc[movie_indices_rec]
-        
-        # Crear el DataFrame de recomendaciones de contenido
-        content_recs = movies_df_content[movies_df_content['movieId'].isin(recommended_movie_ids)]
+        if len(liked_movie_indices):
+            # Crear el perfil del usuario promediando los vectores TF-IDF de las películas que le gustaron
+            user_profile = np.asarray(tfidf_matrix[liked_movie_indices].mean(axis=0)).reshape(1, -1)
+
+            # Las filas de tfidf_matrix están normalizadas: coseno = producto escalar / |perfil|
+            if content_index is not None:
+                movie_indices_rec, similarities = content_index.search(user_profile, tfidf_matrix, top_n*2, exclude=seen_movie_indices)
+            else:
+                # Producto escalar del perfil con todas las películas
+                dot_products = np.asarray(tfidf_matrix @ user_profile.ravel()).ravel()
+
+                # Obtener los top_n*2 más similares excluyendo las que ya ha visto
+                movie_indices_rec = top_k(dot_products, top_n*2, exclude=seen_movie_indices)
+                similarities = dot_products[movie_indices_rec]
+            profile_norm = np.linalg.norm(user_profile)
+            if profile_norm > 0:
+                similarities = similarities / profile_norm
+            ids.append(np.asarray(content_movie_ids)[movie_indices_rec])
+            scores.append(similarities)
+            sources.append(np.full(len(movie_indices_rec), "content", dtype=object))
 
     # 3. Combinar y eliminar duplicados (dando prioridad a las colaborativas)
-    hybrid_recs = pd.concat([collab_recs, content_recs]).drop_duplicates(subset='movieId').head(top_n)
-    
-    return hybrid_recs
+    ids, scores, sources = np.concatenate(ids), np.concatenate(scores), np.concatenate(sources)
+    _, first = np.unique(ids, return_index=True)
+    keep = np.sort(first)[:top_n]
+    return ids[keep], scores[keep], sources[keep]
+
+def get_hybrid_recommendations(user_id, movies, user_ratings, matrix, neighbors, movies_df_content, tfidf_matrix, movie_indices, top_n=10):
+    # movie_indices (Series movieId -> fila) da las mismas filas que un MovieIndex sobre los ids
+    content_movie_ids = movies_df_content['movieId'].to_numpy()
+    ids, scores, sources = score_hybrid_recommendations(
+        user_id, user_ratings, matrix, neighbors, tfidf_matrix, MovieIndex(content_movie_ids), content_movie_ids, top_n=top_n
+    )
+    hybrid_recs = pd.DataFrame({'movieId': ids, 'score': scores, 'source': sources})
+    hybrid_recs['title'] = hybrid_recs['movieId'].map(movies.set_index('movieId')['title'])
+    return hybrid_recs.dropna(subset=['title'])[['movieId', 'title', 'score', 'source']]
@@ -1,2 +1,176 @@
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+# Número de vecinos por usuario que se guardan para el filtrado colaborativo: con k acotado la
+# matriz de vecinos ocupa usuarios x k en lugar de usuarios x usuarios. k=None guarda todos
+# (mismo resultado que el cálculo completo) y solo conviene con pocos usuarios.
+USER_NEIGHBORS_K = 50
+
+class UserItemMatrix:
+    # Matriz usuario x película en formato CSR con los mapas userId/movieId <-> fila/columna
+    def __init__(self, matrix, user_ids, movie_ids):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.user_ids = np.asarray(user_ids)
+        self.movie_ids = np.asarray(movie_ids)
+        self._normalized = None
+        # Ratings recibidos después del precálculo: userId -> {movieId: rating}
+        self._updates = {}
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def updated_users(self):
+        return self._updates.keys()
+
+    def __contains__(self, user_id):
+        return self.user_index(user_id) is not None or user_id in self._updates
+
+    def user_index(self, user_id):
+        return _lookup(self.user_ids, user_id)
+
+    def movie_index(self, movie_id):
+        return _lookup(self.movie_ids, movie_id)
+
+    def user_row(self, user_idx):
+        # Índices de columna y ratings de las películas que ha visto el usuario
+        start, stop = self.matrix.indptr[user_idx], self.matrix.indptr[user_idx + 1]
+        return self.matrix.indices[start:stop], self.matrix.data[start:stop]
+
+    def user_vector(self, user_id):
+        # Como user_row pero por userId e incluyendo los ratings recibidos tras el precálculo
+        user_idx = self.user_index(user_id)
+        if user_idx is None:
+            indices, values = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        else:
+            indices, values = self.user_row(user_idx)
+        updates = self._updates.get(user_id)
+        if not updates:
+            return indices, values
+
+        row = dict(zip(indices.tolist(), values.tolist()))
+        for movie_id, rating in updates.items():
+            movie_idx = self.movie_index(movie_id)
+            # Las películas nuevas no tienen columna hasta la próxima compactación
+            if movie_idx is not None:
+                row[movie_idx] = rating
+        return (np.fromiter(row.keys(), dtype=np.int32, count=len(row)),
+                np.fromiter(row.values(), dtype=np.float32, count=len(row)))
+
+    def normalized(self):
+        # Filas normalizadas (L2) para calcular similitudes coseno; se calcula una sola vez
+        if self._normalized is None:
+            self._normalized = normalize(self.matrix)
+        return self._normalized
+
+    def stored_rating(self, user_id, movie_id):
+        # Rating de la matriz precalculada (sin los recibidos después), o None
+        user_idx, movie_idx = self.user_index(user_id), self.movie_index(movie_id)
+        if user_idx is None or movie_idx is None:
+            return None
+        indices, values = self.user_row(user_idx)
+        match = np.flatnonzero(indices == movie_idx)
+        return float(values[match[0]]) if len(match) else None
+
+    def apply_rating(self, user_id, movie_id, rating):
+        # Devuelve False si la matriz ya tenía ese mismo rating (p. ej. uno que el precálculo ya incluía)
+        updates = self._updates.get(user_id)
+        if (updates is None or movie_id not in updates) and self.stored_rating(user_id, movie_id) == rating:
+            return False
+        self._updates.setdefault(user_id, {})[movie_id] = rating
+        return True
+
+def _lookup(sorted_ids, value):
+    pos = np.searchsorted(sorted_ids, value)
+    if pos < len(sorted_ids) and sorted_ids[pos] == value:
+        return int(pos)
+    return None
+
 def build_user_item_matrix(ratings):
-    return ratings.pivot(index='userId', columns='movieId', values='rating').fillna(0)
\ No newline at end of file
+    return build_user_item_matrix_from_arrays(
+        ratings['userId'].to_numpy(), ratings['movieId'].to_numpy(), ratings['rating'].to_numpy()
+    )
+
+def build_user_item_matrix_from_chunks(chunks):
+    # Igual que build_user_item_matrix pero a partir de bloques de ratings (p. ej. leídos de la
+    # base de datos con iter_rating_chunks): de cada bloque solo se guardan tres arrays compactos
+    # (12 bytes por rating), nunca el DataFrame completo
+    user_ids, movie_ids, ratings = [], [], []
+    for chunk in chunks:
+        user_ids.append(chunk['userId'].to_numpy(dtype=np.int32))
+        movie_ids.append(chunk['movieId'].to_numpy(dtype=np.int32))
+        ratings.append(chunk['rating'].to_numpy(dtype=np.float32))
+    if not user_ids:
+        return build_user_item_matrix_from_arrays(np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+    return build_user_item_matrix_from_arrays(np.concatenate(user_ids), np.concatenate(movie_ids), np.concatenate(ratings))
+
+def build_user_item_matrix_from_arrays(user_ids, movie_ids, ratings):
+    user_ids, user_idx = np.unique(user_ids, return_inverse=True)
+    movie_ids, movie_idx = np.unique(movie_ids, return_inverse=True)
+    # Si un usuario calificó varias veces la misma película nos quedamos con el último rating:
+    # np.unique sobre las claves invertidas da la última aparición de cada (usuario, película)
+    keys = user_idx.astype(np.int64) * len(movie_ids) + movie_idx
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = len(keys) - 1 - last
+    matrix = sparse.csr_matrix(
+        (np.asarray(ratings, dtype=np.float32)[keep], (user_idx[keep], movie_idx[keep])),
+        shape=(len(user_ids), len(movie_ids)), dtype=np.float32
+    )
+    return UserItemMatrix(matrix, user_ids.astype(np.int32), movie_ids.astype(np.int32))
+
+def build_user_neighbors(user_item_matrix, k=USER_NEIGHBORS_K, block_size=1024):
+    # Matriz dispersa usuario x usuario con los k vecinos más similares (coseno) de cada usuario.
+    # Se calcula por bloques para no materializar nunca la matriz completa usuarios x usuarios.
+    # Con k=None se guardan todos los vecinos y el resultado es idéntico al cálculo completo.
+    normalized = user_item_matrix.normalized()
+    n_users = normalized.shape[0]
+    k = n_users - 1 if k is None else max(min(k, n_users - 1), 0)
+
+    rows, cols, values = [], [], []
+    for start in range(0, n_users, block_size):
+        stop = min(start + block_size, n_users)
+        sims = (normalized[start:stop] @ normalized.T).toarray()
+        block_rows = np.arange(stop - start)
+        # El propio usuario no cuenta como vecino
+        sims[block_rows, block_rows + start] = 0
+        if k == 0:
+            continue
+        top = np.argpartition(sims, -k, axis=1)[:, -k:]
+        top_sims = sims[block_rows[:, None], top]
+        mask = top_sims > 0
+        rows.append(np.repeat(block_rows + start, mask.sum(axis=1)))
+        cols.append(top[mask])
+        values.append(top_sims[mask])
+
+    if not rows:
+        return sparse.csr_matrix((n_users, n_users), dtype=np.float32)
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_users, n_users), dtype=np.float32
+    )
+
+def compute_user_neighbor_row(user_item_matrix, user_id, k=USER_NEIGHBORS_K):
+    # Fila de vecinos de un solo usuario calculada al vuelo (usuarios con ratings nuevos).
+    # Mismo criterio que build_user_neighbors pero con el vector actualizado del usuario.
+    n_users, n_movies = user_item_matrix.shape
+    indices, values = user_item_matrix.user_vector(user_id)
+    vector = sparse.csr_matrix((values, (np.zeros(len(indices), dtype=np.int32), indices)), shape=(1, n_movies))
+    sims = (user_item_matrix.normalized() @ normalize(vector).T).toarray().ravel()
+
+    user_idx = user_item_matrix.user_index(user_id)
+    if user_idx is not None:
+        sims[user_idx] = 0
+
+    if k is None or k >= n_users:
+        top = np.arange(n_users)
+    elif k > 0:
+        top = np.argpartition(sims, -k)[-k:]
+    else:
+        top = np.empty(0, dtype=np.intp)
+    top = top[sims[top] > 0]
+    return sparse.csr_matrix(
+        (sims[top].astype(np.float32), (np.zeros(len(top), dtype=np.int32), top)),
+        shape=(1, n_users), dtype=np.float32
+    )
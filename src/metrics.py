@@ -0,0 +1,27 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class LatencyStats:
+    # Número de llamadas y tiempo medio/máximo por nombre (p. ej. por modelo de recomendación)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        yield
+        self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, maximum = self._stats.get(name, (0, 0.0, 0.0))
+            self._stats[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {"count": count, "avg_ms": 1000 * total / count, "max_ms": 1000 * maximum}
+                for name, (count, total, maximum) in self._stats.items()
+            }
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Index, DDL, event
 from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -13,6 +13,23 @@ class Movie(Base):
     ratings = relationship("Rating", back_populates="movie")
     tags = relationship("Tag", back_populates="movie")
 
+# Índice full-text (FTS5) de títulos y géneros para /movies/search, solo en SQLite. Es una tabla
+# de contenido externo (no duplica el texto) que los triggers mantienen al día con `movies`.
+MOVIES_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+    "title, genres, content='movies', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN "
+    "INSERT INTO movies_fts(rowid, title, genres) VALUES (new.id, new.title, new.genres); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN "
+    "INSERT INTO movies_fts(movies_fts, rowid, title, genres) VALUES ('delete', old.id, old.title, old.genres); END",
+    "CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE ON movies BEGIN "
+    "INSERT INTO movies_fts(movies_fts, rowid, title, genres) VALUES ('delete', old.id, old.title, old.genres); "
+    "INSERT INTO movies_fts(rowid, title, genres) VALUES (new.id, new.title, new.genres); END",
+]
+
+for statement in MOVIES_FTS_DDL:
+    event.listen(Movie.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
@@ -41,6 +58,13 @@ class Rating(Base):
     user = relationship("User", back_populates="ratings")
     movie = relationship("Movie", back_populates="ratings")
 
+    __table_args__ = (
+        # Un rating por usuario y película; sirve también para buscar por user_id
+        Index('uq_ratings_user_movie', 'user_id', 'movie_id', unique=True),
+        Index('ix_ratings_movie_id', 'movie_id'),
+        Index('ix_ratings_timestamp', 'timestamp'),
+    )
+
 class Tag(Base):
     __tablename__ = 'tags'
     id = Column(Integer, primary_key=True, index=True)
@@ -51,3 +75,8 @@ class Tag(Base):
     
     user = relationship("User", back_populates="tags")
     movie = relationship("Movie", back_populates="tags")
+
+    __table_args__ = (
+        Index('ix_tags_user_movie', 'user_id', 'movie_id'),
+        Index('ix_tags_movie_id', 'movie_id'),
+    )
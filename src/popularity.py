@@ -1,25 +1,43 @@
-def get_popular_movies(movies_df, ratings_df, top_n=10):
+import re
+import numpy as np
+from src.ranking import top_k
+
+def weighted_scores(counts, sums, quantile=0.90):
+    # Fórmula de IMDb vectorizada sobre los agregados por película.
+    # Las películas que no llegan al umbral de votos quedan con -inf.
+    scores = np.full(len(counts), -np.inf)
+    rated = counts > 0
+    if not rated.any():
+        return scores
+
     # Número mínimo de votos para estar en la lista (umbral)
-    m = ratings_df['movieId'].value_counts().quantile(0.90)  # top 10% más votadas
-    movie_stats = ratings_df.groupby('movieId').agg({
-        'rating': ['mean', 'count']
-    })
-    movie_stats.columns = ['rating_mean', 'rating_count']
-    movie_stats = movie_stats.reset_index()
+    m = np.quantile(counts[rated], quantile)  # top 10% más votadas
+    C = sums[rated].sum() / counts[rated].sum()
 
-    qualified = movie_stats[movie_stats['rating_count'] >= m].copy()
+    qualified = rated & (counts >= m)
+    v = counts[qualified]
+    R = sums[qualified] / v
+    scores[qualified] = (v / (v + m)) * R + (m / (v + m)) * C
+    return scores
 
-    C = ratings_df['rating'].mean()
+def genre_mask(movies_df, genre):
+    pattern = rf"(?:^|\|){re.escape(genre)}(?:\||$)"
+    return movies_df['genres'].fillna('').str.contains(pattern, case=False, regex=True).to_numpy()
 
-    # Fórmula de IMDb
-    qualified['score'] = qualified.apply(
-        lambda x: (x['rating_count'] / (x['rating_count'] + m)) * x['rating_mean'] +
-                  (m / (x['rating_count'] + m)) * C,
-        axis=1
-    )
+def get_popular_movies(movies_df, counts, sums, top_n=10, genre=None):
+    # `counts` y `sums` son el número y la suma de ratings de cada fila de `movies_df`
+    if genre:
+        mask = genre_mask(movies_df, genre)
+        counts = np.where(mask, counts, 0)
+        sums = np.where(mask, sums, 0)
 
-    # Unimos con los títulos
-    popular_movies = qualified.merge(movies_df, on='movieId')
-    popular_movies = popular_movies.sort_values('score', ascending=False)
+    scores = weighted_scores(counts, sums)
+    qualified = np.flatnonzero(np.isfinite(scores))
+    best = qualified[top_k(scores[qualified], top_n)]
 
-    return popular_movies[['movieId', 'title', 'score']].head(top_n).to_dict(orient='records')
\ No newline at end of file
+    movie_ids = movies_df['movieId'].to_numpy()[best].tolist()
+    titles = movies_df['title'].to_numpy()[best].tolist()
+    return [
+        {"movieId": movie_id, "title": title, "score": score}
+        for movie_id, title, score in zip(movie_ids, titles, scores[best].tolist())
+    ]
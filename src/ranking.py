@@ -0,0 +1,45 @@
+import numpy as np
+
+def top_k(scores, k, exclude=None):
+    # Índices de los k mayores valores de `scores`, ordenados de mayor a menor.
+    # `exclude` (índices o máscara booleana) marca posiciones que nunca deben devolverse,
+    # p. ej. la película consultada o las que el usuario ya ha visto.
+    scores = np.asarray(scores).ravel()
+    n_valid = len(scores)
+
+    if exclude is not None:
+        exclude = np.asarray(exclude)
+        if exclude.dtype == bool:
+            exclude = np.flatnonzero(exclude)
+        exclude = np.unique(exclude.astype(np.intp))
+        if len(exclude):
+            scores = scores.astype(np.float64, copy=True)
+            scores[exclude] = -np.inf
+            n_valid -= len(exclude)
+
+    k = min(k, n_valid)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    # argpartition es O(n); solo se ordenan los k candidatos
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def top_k_rows(scores, k):
+    # top_k fila a fila para una matriz de scores (n_filas x n_columnas). Las posiciones
+    # excluidas deben venir a -inf; el llamador descarta las que aparezcan en el resultado.
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.intp)
+
+    if k < n_cols:
+        candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
@@ -0,0 +1,46 @@
+import re
+from sqlalchemy import and_, text
+from sqlalchemy.orm import Session
+from src.models import Movie
+
+def search_movies(db: Session, name: str, genre: str = None, skip: int = 0, limit: int = 100):
+    # Devuelve (total, películas) ordenadas por relevancia. Cada palabra de `name` se busca
+    # como prefijo en el título, así "toy sto" encuentra "Toy Story (1995)" y el año se puede
+    # escribir con o sin paréntesis. `genre` filtra por uno de los géneros de la película.
+    words = _words(name)
+    genre_words = _words(genre) if genre else []
+    if not words:
+        return 0, []
+    if db.bind.dialect.name == "sqlite":
+        return _search_fts(db, words, genre_words, skip, limit)
+    return _search_like(db, words, genre, skip, limit)
+
+def _words(value):
+    return re.findall(r"\w+", value.lower())
+
+def _search_fts(db, words, genre_words, skip, limit):
+    match = "title : (" + " ".join(f'"{word}"*' for word in words) + ")"
+    if genre_words:
+        match += ' AND genres : "' + " ".join(genre_words) + '"'
+
+    total = db.execute(text("SELECT count(*) FROM movies_fts WHERE movies_fts MATCH :match"), {"match": match}).scalar()
+    if not total:
+        return 0, []
+    # bm25 con más peso en el título; a igual relevancia, por id
+    rows = db.execute(text(
+        "SELECT movies.id, movies.title, movies.genres FROM movies_fts "
+        "JOIN movies ON movies.id = movies_fts.rowid "
+        "WHERE movies_fts MATCH :match "
+        "ORDER BY bm25(movies_fts, 10.0, 1.0), movies.id LIMIT :limit OFFSET :skip"
+    ), {"match": match, "limit": limit, "skip": skip}).mappings().all()
+    return total, [dict(row) for row in rows]
+
+def _search_like(db, words, genre, skip, limit):
+    # Otras bases de datos: cada palabra tiene que aparecer en el título, sin ranking
+    conditions = [Movie.title.ilike(f"%{word}%") for word in words]
+    if genre:
+        conditions.append(Movie.genres.ilike(f"%{genre}%"))
+    query = db.query(Movie).filter(and_(*conditions))
+    total = query.count()
+    movies = query.order_by(Movie.id).offset(skip).limit(limit).all()
+    return total, movies
@@ -0,0 +1,342 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from src.models import Movie, Rating, Tag
+
+def rating_keys(user_ids, movie_ids):
+    # Clave de cada (userId, movieId): los dos int32 en un int64, ordenada por usuario y película
+    return (np.asarray(user_ids, dtype=np.int64) << 32) | np.asarray(movie_ids, dtype=np.int64)
+
+class RatingArrays:
+    # Ratings como tres arrays paralelos ordenados por clave (rating_keys): 16 bytes por rating
+    # (clave int64 = userId y movieId int32, rating float32 y timestamp uint32, válido hasta 2106).
+    # Los ratings de un usuario son un slice contiguo y buscar un par es un searchsorted.
+    def __init__(self, keys, ratings, timestamps):
+        self.keys = keys
+        self.ratings = ratings
+        self.timestamps = timestamps
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.uint32))
+
+    @classmethod
+    def from_unsorted(cls, user_ids, movie_ids, ratings, timestamps):
+        return cls.empty().merge(cls(
+            rating_keys(user_ids, movie_ids),
+            np.asarray(ratings, dtype=np.float32),
+            np.asarray(timestamps, dtype=np.uint32),
+        ))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def user_ids(self):
+        return (self.keys >> 32).astype(np.int32)
+
+    @property
+    def movie_ids(self):
+        return (self.keys & 0xFFFFFFFF).astype(np.int32)
+
+    def take(self, index):
+        return RatingArrays(self.keys[index], self.ratings[index], self.timestamps[index])
+
+    def user_slice(self, user_id):
+        start, stop = np.searchsorted(self.keys, [int(user_id) << 32, (int(user_id) + 1) << 32])
+        return self.take(slice(start, stop))
+
+    def merge(self, newer):
+        # Une dos conjuntos de ratings; si un par está en los dos vale el de `newer`
+        keys = np.concatenate([self.keys, newer.keys])
+        if not len(keys):
+            return RatingArrays.empty()
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        # Con el orden estable, la última aparición de cada clave es la más reciente
+        last = np.append(keys[1:] != keys[:-1], True)
+        order = order[last]
+        return RatingArrays(
+            keys[last],
+            np.concatenate([self.ratings, newer.ratings])[order],
+            np.concatenate([self.timestamps, newer.timestamps])[order],
+        )
+
+    def find(self, keys):
+        # Posición de cada clave de `keys` en este conjunto y si está
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions >= len(self.keys)] = 0
+        found = self.keys[positions] == keys if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        return positions, found
+
+    def without(self, keys):
+        # Copia sin los pares de `keys` (ordenadas)
+        if not len(keys) or not len(self.keys):
+            return self
+        positions = np.searchsorted(keys, self.keys)
+        positions[positions >= len(keys)] = 0
+        return self.take(keys[positions] != self.keys)
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'userId': self.user_ids,
+            'movieId': self.movie_ids,
+            'rating': self.ratings,
+            'timestamp': self.timestamps.astype(np.int64),
+        })
+
+class _CatalogState:
+    # Lo que ven las peticiones: no se modifica, cada recarga construye uno nuevo
+    def __init__(self, movies, movie_counts, movie_sums, ratings, pending, tags):
+        self.movies = movies
+        self.movie_counts = movie_counts
+        self.movie_sums = movie_sums
+        self.ratings = ratings
+        self.pending = pending
+        self.tags = tags
+
+    def current_ratings(self, since=None):
+        # Todos los ratings vigentes (los pendientes sustituyen a los compactados), sin ordenar:
+        # solo para recorrerlos enteros. Con `since`, solo los de timestamp >= since.
+        ratings = self.ratings.without(self.pending.keys)
+        ratings = RatingArrays(
+            np.concatenate([ratings.keys, self.pending.keys]),
+            np.concatenate([ratings.ratings, self.pending.ratings]),
+            np.concatenate([ratings.timestamps, self.pending.timestamps]),
+        )
+        if since is None:
+            return ratings
+        return ratings.take(ratings.timestamps >= max(since, 0))
+
+class CatalogStore:
+    # Copia en memoria del catálogo (películas y tags) y de los ratings. Se carga entera una sola
+    # vez y después solo se leen de la base de datos las filas nuevas (id mayor que el último visto) y las
+    # que se han actualizado porque un usuario ha vuelto a valorar una película: esas conservan
+    # su id, así que se buscan por timestamp, releyendo los últimos `update_lookback` segundos.
+    # Los ratings llegados desde la última compactación se guardan aparte (pocos) y se unen al
+    # resto cuando pasan de `compact_threshold`.
+    # Las consultas a la base de datos y la construcción del estado nuevo se hacen sin bloquear
+    # a las peticiones: leen el estado vigente, que solo se sustituye (de golpe) al final.
+    def __init__(self, refresh_interval=5.0, compact_threshold=10000, update_lookback=60):
+        self.refresh_interval = refresh_interval
+        self.compact_threshold = compact_threshold
+        self.update_lookback = update_lookback
+        # Solo una recarga a la vez; quien lee el estado no lo toma
+        self._refresh_lock = threading.Lock()
+        self._loaded = False
+        self._last_refresh = 0.0
+        self._last_movie_id = 0
+        self._last_rating_id = 0
+        self._last_rating_timestamp = None
+        self._last_tag_id = 0
+        self._state = _CatalogState(
+            pd.DataFrame(columns=['movieId', 'title', 'genres']),
+            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64),
+            RatingArrays.empty(), RatingArrays.empty(),
+            pd.DataFrame(columns=['movieId', 'tag', 'timestamp']),
+        )
+        # Aumenta cada vez que cambian películas o ratings; sirve para invalidar cachés
+        self.version = 0
+        self._rating_listeners = []
+        self._content_listeners = []
+
+    def on_ratings(self, callback):
+        # callback(ratings) recibe, después de cada recarga, los ratings nuevos o cambiados
+        # (RatingArrays); en la carga inicial, todos
+        self._rating_listeners.append(callback)
+
+    def on_content(self, callback):
+        # callback(movie_ids) recibe, después de cada recarga, los movieIds de las películas nuevas
+        # o con tags nuevos (array ordenado); en la carga inicial, todos los del catálogo
+        self._content_listeners.append(callback)
+
+    def refresh(self, db: Session, force=False):
+        now = time.monotonic()
+        if self._loaded and not force and now - self._last_refresh < self.refresh_interval:
+            return
+        # Si ya hay una recarga en curso, las peticiones normales siguen con el estado actual;
+        # las forzadas (después de escribir) y la carga inicial esperan a que termine
+        if not self._refresh_lock.acquire(blocking=force or not self._loaded):
+            return
+        try:
+            self._refresh(db, now)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, db, now):
+        state = self._state
+        new_movies = _read_movies(db, self._last_movie_id)
+        since = self._last_rating_timestamp - self.update_lookback if self._last_rating_timestamp is not None else None
+        new_ratings, rating_ids = _read_ratings(db, self._last_rating_id, since)
+        new_tags, tag_ids = _read_tags(db, self._last_tag_id)
+
+        movies, counts, sums = state.movies, state.movie_counts, state.movie_sums
+        ratings, pending, tags = state.ratings, state.pending, state.tags
+        changed = False
+
+        if not new_movies.empty:
+            movies = pd.concat([movies, new_movies], ignore_index=True) if self._loaded else new_movies
+            self._last_movie_id = int(new_movies['movieId'].max())
+            counts = np.append(counts, np.zeros(len(new_movies), dtype=np.int64))
+            sums = np.append(sums, np.zeros(len(new_movies), dtype=np.float64))
+            changed = True
+
+        if not new_tags.empty:
+            tags = pd.concat([tags, new_tags], ignore_index=True) if self._loaded else new_tags
+            self._last_tag_id = int(tag_ids.max())
+            changed = True
+
+        if len(new_ratings):
+            self._last_rating_id = max(self._last_rating_id, int(rating_ids.max()))
+            self._last_rating_timestamp = max(self._last_rating_timestamp or 0, int(new_ratings.timestamps.max()))
+            previous = np.full(len(new_ratings), np.nan)
+            if self._loaded:
+                new_ratings, previous = self._changed_ratings(state, new_ratings)
+
+        if len(new_ratings):
+            counts, sums = _add_to_aggregates(movies, counts.copy(), sums.copy(), new_ratings, previous)
+            pending = pending.merge(new_ratings)
+            if not self._loaded or len(pending) >= self.compact_threshold:
+                ratings, pending = ratings.merge(pending), RatingArrays.empty()
+            changed = True
+
+        if changed:
+            self._state = _CatalogState(movies, counts, sums, ratings, pending, tags)
+            self.version += 1
+        loaded, self._loaded = self._loaded, True
+        self._last_refresh = now
+        if len(new_ratings):
+            for callback in self._rating_listeners:
+                callback(new_ratings)
+        if not new_movies.empty or not new_tags.empty:
+            content_changed = movies['movieId'] if not loaded else pd.concat([new_movies['movieId'], new_tags['movieId']])
+            content_changed = np.unique(content_changed.to_numpy(dtype=np.int64))
+            for callback in self._content_listeners:
+                callback(content_changed)
+
+    def _changed_ratings(self, state, ratings):
+        # Descarta las filas releídas que no cambian lo que hay en memoria (timestamp anterior
+        # al guardado, o el mismo y el mismo rating) y devuelve, para las demás, el rating
+        # anterior de ese usuario y película (nan si es nuevo)
+        stored_ratings = np.full(len(ratings), np.nan)
+        stored_timestamps = np.zeros(len(ratings), dtype=np.int64)
+        stored = np.zeros(len(ratings), dtype=bool)
+        # Los pendientes sustituyen a los compactados, así que se miran los últimos
+        for arrays in (state.ratings, state.pending):
+            positions, found = arrays.find(ratings.keys)
+            stored_ratings[found] = arrays.ratings[positions[found]]
+            stored_timestamps[found] = arrays.timestamps[positions[found]]
+            stored |= found
+        timestamps = ratings.timestamps.astype(np.int64)
+        keep = ~stored | (timestamps > stored_timestamps) | ((timestamps == stored_timestamps) & (ratings.ratings != stored_ratings))
+        return ratings.take(keep), stored_ratings[keep]
+
+    def movie_aggregates(self, since=None):
+        # Número de ratings y suma de ratings por película. Con `since` (timestamp) solo se
+        # cuentan los ratings posteriores, calculado al vuelo sobre los arrays en memoria.
+        state = self._state
+        if since is None:
+            return state.movies, state.movie_counts.copy(), state.movie_sums.copy()
+        recent = state.current_ratings(since=since)
+        positions, found = _movie_positions(state.movies, recent.movie_ids)
+        n_movies = len(state.movies)
+        counts = np.bincount(positions[found], minlength=n_movies)
+        sums = np.bincount(positions[found], weights=recent.ratings[found], minlength=n_movies)
+        return state.movies, counts, sums
+
+    @property
+    def movies(self):
+        return self._state.movies
+
+    def titles(self, movie_ids):
+        # Títulos de `movie_ids` (None si la película no está en el catálogo), sin DataFrames
+        movie_ids = np.asarray(movie_ids)
+        movies = self._state.movies
+        positions, found = _movie_positions(movies, movie_ids)
+        titles = movies['title'].to_numpy()
+        return np.where(found, titles[positions] if len(titles) else None, None)
+
+    def tagged_movies(self, since):
+        # movieIds (ordenados) de las películas con algún tag de timestamp >= since
+        tags = self._state.tags
+        return np.unique(tags['movieId'].to_numpy(dtype=np.int64)[tags['timestamp'].to_numpy() >= since])
+
+    def movie_content(self, movie_ids):
+        # (movieId, título, tags en el orden en que se añadieron) de las películas de `movie_ids`
+        # que están en el catálogo: lo que usa el modelo de contenido
+        state = self._state
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        tags = state.tags[state.tags['movieId'].isin(movie_ids)]
+        movie_tags = tags.groupby('movieId', sort=False)['tag'].agg(list).to_dict()
+        return [
+            (int(movie_id), title, movie_tags.get(movie_id, []))
+            for movie_id, title in zip(movie_ids.tolist(), self.titles(movie_ids))
+            if title is not None
+        ]
+
+    def current_ratings(self, since=None):
+        # Todos los ratings vigentes como RatingArrays (sin ordenar); con `since`, solo los de
+        # timestamp >= since
+        return self._state.current_ratings(since=since)
+
+    @property
+    def ratings(self):
+        # Tabla completa como DataFrame (se construye en cada llamada; las peticiones usan user_ratings)
+        return self.current_ratings().to_frame()
+
+    def user_ratings(self, user_id):
+        state = self._state
+        user_ratings = state.ratings.user_slice(user_id)
+        pending = state.pending.user_slice(user_id)
+        if len(pending):
+            user_ratings = user_ratings.merge(pending)
+        return user_ratings.to_frame()
+
+def _add_to_aggregates(movies, counts, sums, ratings, previous):
+    # `previous` es el rating que sustituye cada fila (nan si es un rating nuevo)
+    positions, found = _movie_positions(movies, ratings.movie_ids)
+    is_new = np.isnan(previous)
+    deltas = ratings.ratings - np.where(is_new, 0, previous)
+    np.add.at(counts, positions[found], is_new[found].astype(np.int64))
+    np.add.at(sums, positions[found], deltas[found])
+    return counts, sums
+
+def _movie_positions(movies, movie_ids):
+    # Posición de cada movieId en `movies` (que está ordenado por id)
+    catalog_ids = movies['movieId'].to_numpy()
+    positions = np.searchsorted(catalog_ids, movie_ids)
+    positions[positions >= len(catalog_ids)] = 0
+    found = catalog_ids[positions] == movie_ids if len(catalog_ids) else np.zeros(len(movie_ids), dtype=bool)
+    return positions, found
+
+def _read_movies(db: Session, after_id):
+    query = db.query(Movie.id, Movie.title, Movie.genres).filter(Movie.id > after_id).order_by(Movie.id)
+    movies = pd.read_sql(query.statement, db.bind)
+    movies.rename(columns={'id': 'movieId'}, inplace=True)
+    return movies
+
+def _read_tags(db: Session, after_id):
+    # Los tags no se modifican: basta con leer los de id posterior a `after_id`, en orden
+    query = db.query(Tag.id, Tag.movie_id, Tag.tag, Tag.timestamp).filter(Tag.id > after_id).order_by(Tag.id)
+    rows = pd.read_sql(query.statement, db.bind)
+    tags = pd.DataFrame({
+        'movieId': rows['movie_id'].to_numpy(dtype=np.int64),
+        'tag': rows['tag'].astype(str).to_numpy(),
+        'timestamp': rows['timestamp'].fillna(0).to_numpy(dtype=np.int64),
+    })
+    return tags, rows['id'].to_numpy()
+
+def _read_ratings(db: Session, after_id, since=None):
+    # Filas con id posterior a `after_id` y, con `since`, también las de timestamp >= since.
+    # Ordenadas por id para que, si un par se repite, gane siempre la fila más reciente.
+    condition = Rating.id > after_id if since is None else or_(Rating.id > after_id, Rating.timestamp >= since)
+    query = db.query(Rating.id, Rating.user_id, Rating.movie_id, Rating.rating, Rating.timestamp).filter(condition).order_by(Rating.id)
+    rows = pd.read_sql(query.statement, db.bind)
+    ratings = RatingArrays.from_unsorted(
+        rows['user_id'].to_numpy(), rows['movie_id'].to_numpy(),
+        rows['rating'].to_numpy(), rows['timestamp'].fillna(0).to_numpy(),
+    )
+    return ratings, rows['id'].to_numpy()
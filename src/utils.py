@@ -1,4 +1,6 @@
 import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from src.models import Movie, Rating, Tag
 
@@ -11,3 +13,47 @@ def get_data_from_db(db: Session):
     ratings.rename(columns={'user_id': 'userId', 'movie_id': 'movieId'}, inplace=True)
     tags.rename(columns={'user_id': 'userId', 'movie_id': 'movieId'}, inplace=True)
     return movies, ratings, tags
+
+def get_movies_and_tags(db: Session):
+    movies = pd.read_sql(db.query(Movie.id.label('movieId'), Movie.title, Movie.genres).statement, db.bind)
+    tags = pd.read_sql(db.query(Tag.movie_id.label('movieId'), Tag.tag).statement, db.bind)
+    return movies, tags
+
+def iter_rating_chunks(db: Session, chunksize=500000):
+    # Ratings (userId, movieId, rating) en bloques de `chunksize` filas, en orden de id, sin
+    # cargar la tabla entera: con stream_results el driver usa un cursor de servidor si lo tiene
+    query = db.query(Rating.user_id.label('userId'), Rating.movie_id.label('movieId'), Rating.rating).order_by(Rating.id)
+    connection = db.connection(execution_options={"stream_results": True})
+    yield from pd.read_sql(query.statement, connection, chunksize=chunksize)
+
+def get_user_ratings(db: Session, user_id: int):
+    # Usa el índice único (user_id, movie_id)
+    query = db.query(Rating.movie_id, Rating.rating, Rating.timestamp).filter(Rating.user_id == user_id)
+    ratings = pd.read_sql(query.statement, db.bind)
+    ratings.rename(columns={'movie_id': 'movieId'}, inplace=True)
+    return ratings
+
+def get_movie_rating_stats(db: Session, movie_id: int):
+    # Número de ratings y media de una película, con el índice por movie_id
+    count, mean = db.query(func.count(Rating.id), func.avg(Rating.rating)).filter(Rating.movie_id == movie_id).one()
+    return {"movieId": movie_id, "count": count, "mean": mean}
+
+def upsert_rating(db: Session, user_id: int, movie_id: int, rating: float, timestamp: int):
+    # Si el usuario ya había valorado la película se sustituye su rating (y su timestamp)
+    values = {"user_id": user_id, "movie_id": movie_id, "rating": rating, "timestamp": timestamp}
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        statement = insert(Rating).values(**values).on_conflict_do_update(
+            index_elements=[Rating.user_id, Rating.movie_id],
+            set_={"rating": rating, "timestamp": timestamp},
+        )
+        db.execute(statement)
+    else:
+        existing = db.query(Rating).filter(Rating.user_id == user_id, Rating.movie_id == movie_id).first()
+        if existing is None:
+            db.add(Rating(**values))
+        else:
+            existing.rating = rating
+            existing.timestamp = timestamp
+    db.commit()
@@ -0,0 +1,49 @@
+import time
+from fastapi.testclient import TestClient
+import routers.admin
+from dependencies import snapshots
+from src.models import User
+
+def test_health_reports_model_version(client: TestClient):
+    response = client.get("/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "ok"
+    assert "version" in data["model"]
+
+def test_reload_requires_admin_token(client: TestClient):
+    response = client.post("/admin/reload")
+    assert response.status_code == 403
+
+def test_reload_swaps_snapshot(client: TestClient, monkeypatch):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    previous = snapshots.current()
+    version = previous.version
+
+    response = client.post(f"/admin/reload?version={version}", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 202
+    assert response.json()["version"] == version
+
+    deadline = time.time() + 10
+    while snapshots.loading_version is not None and time.time() < deadline:
+        time.sleep(0.05)
+    assert snapshots.current() is not previous
+    assert snapshots.current().version == version
+
+def test_reload_unknown_version(client: TestClient, monkeypatch):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    response = client.post("/admin/reload?version=v0", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 404
+
+def test_revoke_user_tokens(client: TestClient, monkeypatch, session):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    client.post("/auth/register", data={"username": "revoked_user", "password": "testpassword"})
+    token = client.post("/auth/token", data={"username": "revoked_user", "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/movies", headers=headers).status_code == 200
+
+    user_id = session.query(User).filter(User.username == "revoked_user").first().id
+    response = client.post(f"/admin/users/{user_id}/revoke-tokens", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["revoked"] == 1
+    assert client.get("/movies", headers=headers).status_code == 401
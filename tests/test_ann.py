@@ -0,0 +1,19 @@
+import numpy as np
+from sklearn.preprocessing import normalize
+from src.ann import build_ivf_index, IVFIndex
+from src.ranking import top_k
+
+VECTORS = normalize(np.random.default_rng(0).random((200, 16))).astype(np.float32)
+
+def test_probing_every_list_is_exact():
+    index = IVFIndex(*build_ivf_index(VECTORS, n_lists=10))
+    query = VECTORS[3]
+    rows, scores = index.search(query, VECTORS, 5, n_probe=index.n_lists)
+    assert list(rows) == list(top_k(VECTORS @ query, 5))
+    assert np.allclose(scores, VECTORS[rows] @ query)
+
+def test_search_skips_excluded_rows():
+    index = IVFIndex(*build_ivf_index(VECTORS, n_lists=10), n_probe=3)
+    rows, _ = index.search(VECTORS[3], VECTORS, 5, exclude=[3])
+    assert 3 not in rows
+    assert len(rows) == 5
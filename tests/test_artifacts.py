@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from src.artifacts import current_version, hold_version, list_versions, new_version, prune_versions, save_artifacts
+
+def test_versions_written_in_the_same_second_do_not_collide(tmp_path):
+    first = save_artifacts(str(tmp_path), {"values": np.arange(3)})
+    second = save_artifacts(str(tmp_path), {"values": np.arange(4)})
+    assert first != second
+    assert len(list_versions(str(tmp_path))) == 2
+    assert new_version() > current_version(str(tmp_path))
+
+def test_save_refuses_to_overwrite_a_version(tmp_path):
+    save_artifacts(str(tmp_path), {"values": np.arange(3)}, version="v1")
+    with pytest.raises(FileExistsError):
+        save_artifacts(str(tmp_path), {"values": np.arange(4)}, version="v1")
+    assert np.load(tmp_path / "v1" / "values.npy").tolist() == [0, 1, 2]
+
+def test_prune_keeps_current_recent_and_held_versions(tmp_path):
+    for version in ("v1", "v2", "v3", "v4", "v5"):
+        save_artifacts(str(tmp_path), {"values": np.arange(3)}, version=version)
+    held = hold_version(str(tmp_path / "v1"))
+    try:
+        assert prune_versions(str(tmp_path), keep=2) == ["v2"]
+    finally:
+        held.close()
+    assert list_versions(str(tmp_path)) == ["v1", "v3", "v4", "v5"]
+    assert prune_versions(str(tmp_path), keep=2) == ["v1"]
@@ -1,4 +1,5 @@
 from fastapi.testclient import TestClient
+import routers.auth
 from src.models import User
 
 def test_register(client: TestClient):
@@ -13,6 +14,15 @@ def test_register_existing_user(client: TestClient, session):
     assert response.status_code == 400
     assert response.json() == {"detail": "Username already registered"}
 
+def test_register_race_for_the_same_username(client: TestClient, session, monkeypatch):
+    session.add(User(username="raceuser", hashed_password="somehashedpassword"))
+    session.commit()
+    # Both requests passed the lookup before either inserted
+    monkeypatch.setattr(routers.auth, "_find_user", lambda db, username: None)
+    response = client.post("/auth/register", data={"username": "raceuser", "password": "newpassword"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Username already registered"}
+
 def test_login(client: TestClient):
     client.post("/auth/register", data={"username": "testuser2", "password": "testpassword"})
     response = client.post("/auth/token", data={"username": "testuser2", "password": "testpassword"})
@@ -25,4 +35,22 @@ def test_login_incorrect_password(client: TestClient):
     client.post("/auth/register", data={"username": "testuser3", "password": "testpassword"})
     response = client.post("/auth/token", data={"username": "testuser3", "password": "wrongpassword"})
     assert response.status_code == 401
-    assert response.json() == {"detail": "Incorrect username or password"}
\ No newline at end of file
+    assert response.json() == {"detail": "Incorrect username or password"}
+
+def test_logout_revokes_token(client: TestClient):
+    client.post("/auth/register", data={"username": "testuser4", "password": "testpassword"})
+    token = client.post("/auth/token", data={"username": "testuser4", "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/movies", headers=headers).status_code == 200
+    # Second request is served from the token cache
+    assert client.get("/movies", headers=headers).status_code == 200
+
+    response = client.post("/auth/logout", headers=headers)
+    assert response.status_code == 200
+    assert client.get("/movies", headers=headers).status_code == 401
+
+def test_login_rejected_when_hashing_pool_is_full(client: TestClient, monkeypatch):
+    client.post("/auth/register", data={"username": "testuser5", "password": "testpassword"})
+    monkeypatch.setattr(routers.auth.password_executor, "is_full", lambda: True)
+    response = client.post("/auth/token", data={"username": "testuser5", "password": "testpassword"})
+    assert response.status_code == 429
@@ -0,0 +1,36 @@
+from src.cache import RecommendationCache
+
+RECS = [{"movieId": 1, "title": "Toy Story (1995)"}]
+
+def test_hit_after_put():
+    cache = RecommendationCache()
+    assert cache.get(1, ("hybrid", 10), "v1") is None
+    cache.put(1, ("hybrid", 10), "v1", RECS, cache.generation(1))
+    assert cache.get(1, ("hybrid", 10), "v1") == RECS
+    assert cache.get(1, ("hybrid", 10), "v2") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+def test_invalidate_user_only_drops_that_user():
+    cache = RecommendationCache()
+    cache.put(1, ("hybrid", 10), "v1", RECS, cache.generation(1))
+    cache.put(2, ("hybrid", 10), "v1", RECS, cache.generation(2))
+    cache.invalidate_user(1)
+    assert cache.get(1, ("hybrid", 10), "v1") is None
+    assert cache.get(2, ("hybrid", 10), "v1") == RECS
+
+def test_result_computed_before_invalidation_is_not_stored():
+    cache = RecommendationCache()
+    generation = cache.generation(1)
+    cache.invalidate_user(1)
+    cache.put(1, ("hybrid", 10), "v1", RECS, generation)
+    assert cache.get(1, ("hybrid", 10), "v1") is None
+
+def test_evicts_least_recently_used_when_over_memory_limit():
+    cache = RecommendationCache(max_bytes=4096)
+    for user_id in range(100):
+        cache.put(user_id, ("hybrid", 10), "v1", RECS, 0)
+    stats = cache.stats()
+    assert stats["size_bytes"] <= cache.max_bytes
+    assert stats["evictions"] > 0
+    assert cache.get(99, ("hybrid", 10), "v1") == RECS
@@ -0,0 +1,57 @@
+import time
+import numpy as np
+import pandas as pd
+from src.matrix_builder import build_user_item_matrix, build_user_item_matrix_from_chunks, build_user_neighbors, compute_user_neighbor_row
+from src.colaborative import get_user_recommendations
+from src.store import RatingArrays
+from dependencies import PrecomputedDataManager, DATA_PATH
+
+MOVIES = pd.DataFrame({'movieId': [1, 2, 3, 4], 'title': ['A', 'B', 'C', 'D']})
+RATINGS = pd.DataFrame({
+    'userId': [1, 1, 2, 2, 2, 3],
+    'movieId': [1, 2, 1, 2, 3, 4],
+    'rating': [5.0, 4.0, 5.0, 4.0, 5.0, 3.0],
+})
+
+def test_new_user_gets_recommendations_after_rating():
+    matrix = build_user_item_matrix(RATINGS)
+    assert 10 not in matrix
+
+    matrix.apply_rating(10, 1, 5.0)
+    assert 10 in matrix
+
+    neighbors = compute_user_neighbor_row(matrix, 10)
+    recs = get_user_recommendations(10, matrix, neighbors, MOVIES, top_n=1)
+    assert list(recs['movieId']) == [2]
+
+def test_compaction_writes_a_version_with_the_new_ratings(tmp_path):
+    snapshot = PrecomputedDataManager(DATA_PATH)
+    matrix = snapshot.user_item_matrix.matrix.tocoo()
+    user_ids = np.append(snapshot.user_item_matrix.user_ids[matrix.row], 999999)
+    movie_ids = np.append(snapshot.user_item_matrix.movie_ids[matrix.col], 1)
+    ratings = RatingArrays.from_unsorted(user_ids, movie_ids, np.append(matrix.data, 5.0), np.zeros(len(user_ids)))
+
+    version = snapshot.compact(ratings, time.time(), output_path=str(tmp_path))
+    compacted = PrecomputedDataManager(str(tmp_path), version)
+    assert 999999 in compacted.user_item_matrix
+    assert not compacted.user_item_matrix.updated_users
+    assert compacted.user_neighbors.shape[0] == len(snapshot.user_item_matrix.user_ids) + 1
+    assert compacted.metadata["compacted_from"] == snapshot.version
+
+def test_snapshot_applies_only_ratings_newer_than_its_precompute():
+    snapshot = PrecomputedDataManager(DATA_PATH)
+    ratings = RatingArrays.from_unsorted([999998, 999999], [1, 1], [5.0, 5.0], [0, time.time()])
+    assert snapshot.apply_ratings(ratings) == [999999]
+    assert 999999 in snapshot.user_item_matrix
+    assert 999998 not in snapshot.user_item_matrix
+
+def test_updated_neighbor_row_matches_precomputed_row():
+    matrix = build_user_item_matrix(RATINGS)
+    row = compute_user_neighbor_row(matrix, 2)
+    assert abs(row - build_user_neighbors(matrix)[matrix.user_index(2)]).max() < 1e-6
+
+def test_chunked_build_keeps_last_rating():
+    ratings = pd.concat([RATINGS, pd.DataFrame({'userId': [1], 'movieId': [1], 'rating': [1.0]})], ignore_index=True)
+    chunked = build_user_item_matrix_from_chunks([ratings.iloc[:4], ratings.iloc[4:]])
+    assert (chunked.matrix != build_user_item_matrix(ratings).matrix).nnz == 0
+    assert chunked.matrix[chunked.user_index(1), chunked.movie_index(1)] == 1.0
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from src.content import MovieIndex, prepare_content_based, build_content_embeddings, score_similar_movies
+
+MOVIES = pd.DataFrame({
+    'movieId': [1, 2, 3, 4],
+    'title': ['Toy Story (1995)', 'Toy Story 2 (1999)', 'Heat (1995)', 'Casino (1995)'],
+})
+TAGS = pd.DataFrame({'movieId': [1, 3, 4], 'tag': ['pixar', 'crime heist', 'crime mafia']})
+
+def test_embeddings_are_normalized_float32():
+    tfidf_matrix, _, _ = prepare_content_based(MOVIES, TAGS)
+    embeddings, _ = build_content_embeddings(tfidf_matrix, n_components=2)
+    assert embeddings.dtype == np.float32
+    assert embeddings.shape == (4, 2)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5)
+
+def test_similar_movies_with_embeddings():
+    tfidf_matrix, movie_indices, _ = prepare_content_based(MOVIES, TAGS)
+    embeddings, _ = build_content_embeddings(tfidf_matrix, n_components=2)
+    positions, scores = score_similar_movies(1, embeddings, movie_indices, top_n=1)
+    assert list(positions) == [movie_indices[2]]
+
+def test_movie_index_rows_skips_unknown_ids():
+    index = MovieIndex(np.array([30, 10, 20]))
+    rows, found = index.rows(np.array([20, 99, 30, 5]))
+    assert rows.tolist() == [2, 0]
+    assert found.tolist() == [True, False, True, False]
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import pytest
+from src.executor import ExecutorBusy, BoundedExecutor
+
+def test_run_returns_result():
+    executor = BoundedExecutor(max_workers=2, max_queue=0)
+    assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+    assert executor.stats()["completed"] == 1
+
+def test_rejects_when_full():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, timeout=5)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorBusy):
+            await executor.run(sum, [1])
+        release.set()
+        await running
+
+    asyncio.run(main())
+    assert executor.stats()["rejected"] == 1
+
+def test_timeout_keeps_slot_until_work_finishes():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(release.wait)
+        assert executor.is_full()
+        release.set()
+        await asyncio.sleep(0.05)
+        assert not executor.is_full()
+
+    asyncio.run(main())
+    assert executor.stats()["timeouts"] == 1
+
+def test_wait_queues_until_a_slot_is_free():
+    executor = BoundedExecutor(max_workers=1, max_queue=0, timeout=0.05)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(release.wait, timeout=0))
+        await asyncio.sleep(0.1)
+        waiting = asyncio.ensure_future(executor.run(sum, [1, 2], wait=True))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        assert await running
+        assert await waiting == 3
+
+    asyncio.run(main())
+    assert executor.stats()["rejected"] == 0
+    assert executor.stats()["timeouts"] == 0
@@ -1,6 +1,9 @@
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from tests.utils import create_test_movie
+import routers.admin
+from dependencies import content_updater, get_data_manager
+from src.models import Movie
 
 def test_get_all_movies(client: TestClient, session: Session, auth_token: str):
     create_test_movie(session)
@@ -38,4 +41,68 @@ def test_search_movie_not_found(client: TestClient, session: Session, auth_token
     assert response.status_code == 200
     data = response.json()
     assert data["total_count"] == 0
-    assert len(data["movies"]) == 0
\ No newline at end of file
+    assert len(data["movies"]) == 0
+
+def test_search_movie_prefix_year_and_genre(client: TestClient, session: Session, auth_token: str):
+    create_test_movie(session, title="Searchable Story (1995)", genres="Animation|Children")
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    data = client.get("/movies/search?name=searchab sto", headers=headers).json()
+    assert [movie["title"] for movie in data["movies"]] == ["Searchable Story (1995)"]
+
+    data = client.get("/movies/search?name=Searchable Story (1995)", headers=headers).json()
+    assert data["total_count"] == 1
+
+    data = client.get("/movies/search?name=Searchable&genre=Children", headers=headers).json()
+    assert data["total_count"] == 1
+    data = client.get("/movies/search?name=Searchable&genre=Drama", headers=headers).json()
+    assert data["total_count"] == 0
+
+def test_get_all_movies_keyset_pages(client: TestClient, session: Session, auth_token: str):
+    create_test_movie(session, title="Page Movie 1")
+    create_test_movie(session, title="Page Movie 2")
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    ids, cursor, total_count = [], None, None
+    while True:
+        url = "/movies?limit=1&fields=title" + (f"&cursor={cursor}" if cursor else "")
+        data = client.get(url, headers=headers).json()
+        total_count = data["total_count"]
+        assert all(set(movie) == {"id", "title"} for movie in data["movies"])
+        ids += [movie["id"] for movie in data["movies"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == sorted(ids)
+    assert len(ids) == total_count
+
+def test_get_all_movies_invalid_cursor(client: TestClient, auth_token: str):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    assert client.get("/movies?cursor=not-a-cursor", headers=headers).status_code == 400
+    assert client.get("/movies?fields=budget", headers=headers).status_code == 400
+
+def test_new_movie_and_tags_update_content_model(client: TestClient, session: Session, auth_token: str, monkeypatch):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    # Movies added after a precompute get ids beyond those of the model
+    session.add(Movie(id=900000, title="Placeholder (2030)"))
+    session.commit()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    assert client.post("/movies", json={"title": "Toy Story 5 (2030)"}).status_code == 403
+    response = client.post("/movies", json={"title": "Toy Story 5 (2030)", "genres": "Animation"}, headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 201
+    movie_id = response.json()["id"]
+    content_updater.wait()
+    content = get_data_manager().content
+    assert movie_id in content.movie_indices
+
+    response = client.get(f"/recommendations/recommend/content/{movie_id}?top_n=3", headers=headers)
+    assert response.status_code == 200
+    assert "Toy Story" in response.json()[0]["title"]
+
+    vector = content.vectors[content.movie_indices[movie_id]].copy()
+    assert client.post(f"/movies/{movie_id}/tags", json={"tag": "pixar"}, headers=headers).status_code == 201
+    content_updater.wait()
+    content = get_data_manager().content
+    assert (content.vectors[content.movie_indices[movie_id]] != vector).nnz > 0
+    assert client.post("/movies/99999999/tags", json={"tag": "pixar"}, headers=headers).status_code == 404
@@ -0,0 +1,14 @@
+import numpy as np
+from src.ranking import top_k
+
+def test_top_k_orders_by_score():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert list(top_k(scores, 3)) == [1, 3, 2]
+
+def test_top_k_excludes_indices():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert list(top_k(scores, 2, exclude=[1])) == [3, 2]
+
+def test_top_k_never_returns_excluded_items():
+    scores = np.array([0.1, 0.9, 0.5])
+    assert list(top_k(scores, 10, exclude=np.array([False, True, False]))) == [2, 0]
@@ -1,4 +1,9 @@
+import json
+import time
 from fastapi.testclient import TestClient
+from src.models import Rating
+import routers.admin
+import routers.recommendations
 
 def test_get_popular_movies(client: TestClient, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
@@ -29,9 +34,63 @@ def test_recommend(client: TestClient, rated_auth_token):
     if response.json(): # Check if the list is not empty
         assert isinstance(response.json()[0], dict)
 
+def test_recommend_svd(client: TestClient, rated_auth_token):
+    headers = {"Authorization": f"Bearer {rated_auth_token}"}
+    response = client.get("/recommendations/recommend?model=svd", headers=headers)
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+    assert client.get("/recommendations/recommend?model=unknown", headers=headers).status_code == 400
+    assert "svd" in client.get("/health").json()["scoring_latency"]
+
 def test_rate_movie(client: TestClient, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     rating_data = {"movie_id": 2, "rating": 5.0}
     response = client.post("/recommendations/rate", headers=headers, json=rating_data)
     assert response.status_code == 200
-    assert response.json() == {"message": "Rating submitted successfully"}
\ No newline at end of file
+    assert response.json() == {"message": "Rating submitted successfully"}
+
+def test_get_popular_movies_filtered(client: TestClient, rated_auth_token):
+    headers = {"Authorization": f"Bearer {rated_auth_token}"}
+    response = client.get("/recommendations/populars?genre=Test&days=7", headers=headers)
+    assert response.status_code == 200
+    assert isinstance(response.json(), list)
+
+def test_recommend_batch(client: TestClient, monkeypatch):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+    response = client.post("/recommendations/batch", headers=headers, json={"user_ids": [1, 999999], "top_n": 5})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["userId"] for line in lines] == [1, 999999]
+    assert len(lines[0]["recommendations"]) <= 5
+    assert lines[1]["recommendations"] == []
+
+    response = client.post("/recommendations/batch", headers=headers, json={"user_ids": [1], "model": "svd"})
+    assert response.status_code == 400
+
+def test_recommend_batch_ends_with_an_error_line_when_a_chunk_times_out(client: TestClient, monkeypatch):
+    monkeypatch.setattr(routers.admin, "ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(routers.recommendations, "BATCH_CHUNK_SIZE", 1)
+    monkeypatch.setattr(routers.recommendations, "RECOMMENDER_BATCH_TIMEOUT_SECONDS", 0.2)
+    score_batch = routers.recommendations.iter_batch_recommendations
+
+    def slow_second_chunk(data_manager, user_ids, **kwargs):
+        if user_ids == [2]:
+            time.sleep(0.5)
+        return score_batch(data_manager, user_ids, **kwargs)
+
+    monkeypatch.setattr(routers.recommendations, "iter_batch_recommendations", slow_second_chunk)
+    response = client.post("/recommendations/batch", headers={"X-Admin-Token": "secret"}, json={"user_ids": [1, 2, 3]})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["userId"] == 1
+    assert lines[1]["userIds"] == [2]
+    assert "timed out" in lines[1]["error"]
+    assert len(lines) == 2
+
+def test_rate_movie_twice_keeps_one_rating(client: TestClient, auth_token, session):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    client.post("/recommendations/rate", headers=headers, json={"movie_id": 3, "rating": 2.0})
+    client.post("/recommendations/rate", headers=headers, json={"movie_id": 3, "rating": 4.0})
+    ratings = session.query(Rating).filter(Rating.movie_id == 3).all()
+    assert [rating.rating for rating in ratings] == [4.0]
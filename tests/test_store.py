@@ -0,0 +1,130 @@
+import threading
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.models import Base, Movie, Rating, Tag
+import src.store
+from src.store import CatalogStore
+from src.utils import get_movie_rating_stats, get_user_ratings, upsert_rating
+from dependencies import DATA_PATH, PrecomputedDataManager
+
+def make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Movie(id=1, title="A", genres="Drama"), Movie(id=2, title="B", genres="Comedy")])
+    db.commit()
+    return db
+
+def test_upsert_replaces_previous_rating():
+    db = make_session()
+    upsert_rating(db, 1, 1, 3.0, 100)
+    upsert_rating(db, 1, 1, 5.0, 200)
+    assert db.query(Rating).count() == 1
+    ratings = get_user_ratings(db, 1)
+    assert ratings[['movieId', 'rating', 'timestamp']].values.tolist() == [[1, 5.0, 200]]
+    assert get_movie_rating_stats(db, 1) == {"movieId": 1, "count": 1, "mean": 5.0}
+
+def test_store_picks_up_updated_ratings():
+    db = make_session()
+    upsert_rating(db, 1, 1, 3.0, 100)
+    upsert_rating(db, 2, 1, 4.0, 100)
+    store = CatalogStore()
+    store.refresh(db, force=True)
+
+    upsert_rating(db, 1, 1, 5.0, 200)
+    store.refresh(db, force=True)
+    store.refresh(db, force=True)
+
+    assert store.user_ratings(1)[['movieId', 'rating']].values.tolist() == [[1, 5.0]]
+    assert len(store.ratings) == 2
+    _, counts, sums = store.movie_aggregates()
+    assert counts.tolist() == [2, 0]
+    assert sums.tolist() == [9.0, 0.0]
+
+def test_requests_read_the_store_while_it_refreshes(monkeypatch):
+    db = make_session()
+    upsert_rating(db, 1, 1, 3.0, 100)
+    store = CatalogStore()
+    store.refresh(db, force=True)
+    assert store._state.ratings.ratings.dtype == np.float32
+
+    started, release = threading.Event(), threading.Event()
+    read_ratings = src.store._read_ratings
+
+    def slow_read_ratings(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return read_ratings(*args, **kwargs)
+
+    monkeypatch.setattr(src.store, "_read_ratings", slow_read_ratings)
+    upsert_rating(db, 1, 2, 4.0, 200)
+    refresh = threading.Thread(target=store.refresh, args=(db,), kwargs={"force": True})
+    refresh.start()
+    assert started.wait(5)
+    # The refresh is stuck half way: reads do not wait and see the previous state
+    assert store.user_ratings(1)['movieId'].tolist() == [1]
+    assert store.titles([2]).tolist() == ["B"]
+    release.set()
+    refresh.join()
+    assert store.user_ratings(1)['movieId'].tolist() == [1, 2]
+
+def test_store_skips_reread_rows_that_are_not_newer():
+    db = make_session()
+    upsert_rating(db, 1, 1, 3.0, 100)
+    store = CatalogStore()
+    store.refresh(db, force=True)
+    changed = []
+    store.on_ratings(changed.append)
+
+    # An unchanged reread and a row older than the stored one change nothing; a new rating in the same second does
+    store.refresh(db, force=True)
+    db.query(Rating).update({Rating.rating: 1.0, Rating.timestamp: 50})
+    db.commit()
+    store.refresh(db, force=True)
+    assert changed == []
+    assert store.user_ratings(1)['rating'].tolist() == [3.0]
+
+    db.query(Rating).update({Rating.rating: 4.0, Rating.timestamp: 100})
+    db.commit()
+    store.refresh(db, force=True)
+    assert [len(ratings) for ratings in changed] == [1]
+    assert store.user_ratings(1)['rating'].tolist() == [4.0]
+    _, counts, sums = store.movie_aggregates()
+    assert counts.tolist() == [1, 0]
+    assert sums.tolist() == [4.0, 0.0]
+
+def test_store_reports_new_movies_and_tags():
+    db = make_session()
+    db.add(Tag(user_id=1, movie_id=1, tag="old", timestamp=100))
+    db.commit()
+    store = CatalogStore()
+    changed = []
+    store.on_content(changed.append)
+    store.refresh(db, force=True)
+
+    db.add_all([Movie(id=3, title="C", genres="Drama"), Tag(user_id=1, movie_id=2, tag="heist", timestamp=200), Tag(user_id=2, movie_id=2, tag="crime", timestamp=300)])
+    db.commit()
+    store.refresh(db, force=True)
+    assert [ids.tolist() for ids in changed] == [[1, 2], [2, 3]]
+    assert store.tagged_movies(since=150).tolist() == [2]
+    assert store.movie_content([2, 3, 99]) == [(2, "B", ["heist", "crime"]), (3, "C", [])]
+
+def test_snapshot_content_is_stale_for_new_movies_and_recent_tags():
+    db = make_session()
+    db.add_all([Movie(id=999999, title="Toy Story 5 (2030)", genres="Animation"), Tag(user_id=1, movie_id=2, tag="pixar", timestamp=0)])
+    db.commit()
+    store = CatalogStore()
+    store.refresh(db, force=True)
+    snapshot = PrecomputedDataManager(DATA_PATH)
+    assert snapshot.stale_content(store).tolist() == [999999]
+
+    db.add(Tag(user_id=1, movie_id=1, tag="pixar", timestamp=int(snapshot.content_read_at) + 10))
+    db.commit()
+    store.refresh(db, force=True)
+    assert snapshot.stale_content(store).tolist() == [1, 999999]
+
+    for movie_id, title, tags in store.movie_content(snapshot.stale_content(store)):
+        assert snapshot.update_movie_content(movie_id, title, tags)
+    assert 999999 in snapshot.content.movie_indices